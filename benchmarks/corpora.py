@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Reproducible synthetic corpora for the benchmark suite.
+
+Every corpus is generated from a seeded random generator, so the same size and seed always give the same file.
+Matches are planted at known rates (selectivities), the fraction of lines, cells or sequence positions that hold
+a match of the pattern of that selectivity.
+"""
+
+from __future__ import annotations
+
+import os, random
+from typing import Final
+
+WORDS: Final[tuple] = ('alpha', 'beta', 'gamma', 'delta', 'error', 'warning', 'info', 'debug', 'request', 'response',
+                       'user', 'session', 'timeout', 'connect', 'query', 'index', 'cache', 'worker', 'start', 'stop')
+
+SELECTIVITIES: Final[dict[str, float]] = {'rare': 0.001, 'common': 0.01, 'dense': 0.1}
+
+# Patterns of every selectivity. For FASTA files, a random motif of length k occurs at 4^-k of the positions.
+PATTERNS: Final[dict[str, dict[str, str]]] = {
+    'txt': {s: rf'hit_{s}_\d+' for s in SELECTIVITIES},
+    'csv': {s: rf'hit_{s}_\d+' for s in SELECTIVITIES},
+    'tsv': {s: rf'hit_{s}_\d+' for s in SELECTIVITIES},
+    'fasta': {'rare': 'ACGTTGCA[AT]C', 'common': 'ACGTTGC', 'dense': 'ACGTT'},
+}
+
+_DNA = bytes(b'ACGT'[i % 4] for i in range(256))
+
+def _txt_line(rng: random.Random) -> str:
+    """Generate a log like line, with the planted matches of every selectivity.
+
+    Args:
+        * `rng` (random.Random): Random generator.
+
+    Returns:
+        `str`: Line, without the newline.
+    """
+
+    words = rng.choices(WORDS, k = rng.randint(4, 12))
+    for s, p in SELECTIVITIES.items():
+        if rng.random() < p:
+            words.insert(rng.randrange(len(words) + 1), f'hit_{s}_{rng.randrange(1000)}')
+    return ' '.join(words)
+
+def _write_txt(fl: str, size: int, rng: random.Random) -> None:
+    """Write a text corpus of about size bytes.
+
+    Args:
+        * `fl` (str): Output file name/path.
+        * `size` (int): Size in bytes.
+        * `rng` (random.Random): Random generator.
+    """
+
+    written = 0
+    with open(fl, 'w') as f:
+        while written < size:
+            line = _txt_line(rng = rng) + '\n'
+            f.write(line)
+            written += len(line)
+
+def _write_sp(fl: str, size: int, rng: random.Random, sep: str) -> None:
+    """Write a spreadsheet corpus of about size bytes. The note column holds the planted matches as whole cells.
+
+    Args:
+        * `fl` (str): Output file name/path.
+        * `size` (int): Size in bytes.
+        * `rng` (random.Random): Random generator.
+        * `sep` (str): Delimiter.
+    """
+
+    written = 0
+    with open(fl, 'w') as f:
+        f.write(sep.join(('id', 'user', 'event', 'code', 'note')) + '\n')
+        row = 0
+        while written < size:
+            note = rng.choice(WORDS)
+            for s, p in SELECTIVITIES.items():
+                if rng.random() < p:
+                    note = f'hit_{s}_{rng.randrange(1000)}'
+            line = sep.join((str(row), rng.choice(WORDS), rng.choice(WORDS), str(rng.randrange(100000)), note)) + '\n'
+            f.write(line)
+            written += len(line)
+            row += 1
+
+def _write_fasta(fl: str, size: int, rng: random.Random, record_len: int = 100000, width: int = 60) -> None:
+    """Write a FASTA corpus of about size bytes, with records of record_len bases wrapped at width columns.
+
+    Args:
+        * `fl` (str): Output file name/path.
+        * `size` (int): Size in bytes.
+        * `rng` (random.Random): Random generator.
+        * `record_len` (int, optional): Bases per record. Defaults to 100000.
+        * `width` (int, optional): Line width of the sequences. Defaults to 60.
+    """
+
+    written, rec = 0, 0
+    with open(fl, 'wb') as f:
+        while written < size:
+            seq = rng.randbytes(record_len).translate(_DNA)
+            header = f'>rec{rec} synthetic record {rec}\n'.encode()
+            f.write(header)
+            f.write(b'\n'.join(seq[i:i + width] for i in range(0, len(seq), width)) + b'\n')
+            written += len(header) + record_len + record_len // width + 1
+            rec += 1
+
+def corpus(kind: str, size_mb: float, seed: int = 0, directory: str = '.') -> str:
+    """Get a corpus file, generating it if it does not exist yet.
+
+    Args:
+        * `kind` (str): txt, fasta, csv or tsv.
+        * `size_mb` (float): Approximate size in MB.
+        * `seed` (int, optional): Seed of the random generator. Defaults to 0.
+        * `directory` (str, optional): Directory of the corpora. Defaults to the working directory.
+
+    Returns:
+        `str`: Corpus file name/path.
+    """
+
+    os.makedirs(directory, exist_ok = True)
+    fl = os.path.join(directory, f'corpus_{size_mb:g}mb_s{seed}.{kind}')
+    if os.path.isfile(fl):
+        return fl
+
+    rng = random.Random(f'{kind}-{size_mb}-{seed}')
+    size = int(size_mb * 1024 ** 2)
+    tmp = f'{fl}.tmp'
+    if kind == 'txt':
+        _write_txt(fl = tmp, size = size, rng = rng)
+    elif kind in ('csv', 'tsv'):
+        _write_sp(fl = tmp, size = size, rng = rng, sep = ',' if kind == 'csv' else '\t')
+    elif kind == 'fasta':
+        _write_fasta(fl = tmp, size = size, rng = rng)
+    else:
+        raise ValueError(f'Corpus type {kind} is not supported. Supported types are: {", ".join(PATTERNS)}')
+    os.replace(tmp, fl)
+    return fl
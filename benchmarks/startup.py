@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""Startup time benchmark of the command line tool, guarding plain text queries against import regressions.
+
+Runs a small text query as a fresh process a number of times and compares its median wall time with the
+startup of a bare interpreter. Fails (exit code 1) when the overhead of the tool exceeds the budget or when
+a heavy dependency is imported on the text query path.
+
+    >>> python benchmarks/startup.py -runs 20 -max_ms 150
+"""
+
+from __future__ import annotations
+
+import argparse, json, os, statistics, subprocess, sys, tempfile, time
+from typing import Final
+
+ROOT: Final[str] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY: Final[tuple] = ('pandas', 'numpy', 'sqlite3', 'psycopg2', 'pyarrow', 'zstandard', 'concurrent.futures')
+
+def _time_runs(cmd: list[str], runs: int) -> list[float]:
+    """Time a command, run as a fresh process.
+
+    Args:
+        * `cmd` (list[str]): Command.
+        * `runs` (int): Number of runs.
+
+    Returns:
+        `list[float]`: Wall time of every run, in milliseconds.
+    """
+
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd = ROOT, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL, check = True)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+def _heavy_imports(fl: str, pattern: str) -> list[str]:
+    """Run a text query in a fresh process and list the heavy dependencies it imported.
+
+    Args:
+        * `fl` (str): Text file to query.
+        * `pattern` (str): Pattern.
+
+    Returns:
+        `list[str]`: Heavy modules found in sys.modules after the query.
+    """
+
+    code = ("import sys, runpy, io, contextlib\n"
+            f"sys.argv = ['query.py', '-f', {fl!r}, '-p', {pattern!r}]\n"
+            "with contextlib.redirect_stdout(io.StringIO()):\n"
+            "    runpy.run_path('query.py', run_name = '__main__')\n"
+            f"print(' '.join(m for m in {HEAVY!r} if m in sys.modules))\n")
+    out = subprocess.run([sys.executable, '-c', code], cwd = ROOT, capture_output = True, text = True, check = True)
+    return out.stdout.split()
+
+def main() -> int:
+    PARSER = argparse.ArgumentParser(description = "Startup time benchmark of query.py for a plain text query.")
+    PARSER.add_argument("-runs", type = int, default = 20, help = "Number of timed runs. Default is 20.")
+    PARSER.add_argument("-max_ms", type = float, default = 150, help = "Budget of the median startup overhead over a bare interpreter, in milliseconds. Default is 150.")
+    PARSER.add_argument("-o", help = "Optional argument: Write the results into this .json file.")
+    ARGS = PARSER.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fl = os.path.join(tmp, 'startup.txt')
+        with open(fl, 'w') as f:
+            f.write('alpha one\nbeta two\ngamma alpha\n')
+        bare = _time_runs(cmd = [sys.executable, '-c', 'pass'], runs = ARGS.runs)
+        tool = _time_runs(cmd = [sys.executable, 'query.py', '-f', fl, '-p', 'alpha'], runs = ARGS.runs)
+        heavy = _heavy_imports(fl = fl, pattern = 'alpha')
+
+    overhead = statistics.median(tool) - statistics.median(bare)
+    results = {'python': sys.version.split()[0], 'runs': ARGS.runs,
+               'bare_median_ms': round(statistics.median(bare), 2), 'query_median_ms': round(statistics.median(tool), 2),
+               'query_min_ms': round(min(tool), 2), 'overhead_ms': round(overhead, 2), 'budget_ms': ARGS.max_ms,
+               'heavy_imports': heavy}
+    print(json.dumps(results, indent = 2))
+    if ARGS.o:
+        with open(ARGS.o, 'w') as f:
+            json.dump(results, f, indent = 2)
+
+    failed = False
+    if heavy:
+        print(f"FAIL: text query imported {', '.join(heavy)}.", file = sys.stderr)
+        failed = True
+    if overhead > ARGS.max_ms:
+        print(f'FAIL: startup overhead {overhead:.1f} ms exceeds the budget of {ARGS.max_ms} ms.', file = sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""Benchmark suite of the search and database paths, on synthetic corpora.
+
+Generates .txt, .fasta, .csv and .tsv corpora at several sizes (see corpora.py) and measures, for every
+search path and pattern selectivity, the throughput (MB/s), the peak RSS and the time to the first match.
+SQLite ingestion is measured in rows/s, both streamed from the search generators and read back from a .json
+output file. Every case runs in a fresh process, so import costs and peak RSS do not leak between cases.
+Results are written as JSON, and a previous results file can be passed to -compare to print the speedups.
+
+    >>> python benchmarks/suite.py -sizes 1 16 64 -o results.json
+    >>> python benchmarks/suite.py -sizes 1 16 64 -compare results.json
+"""
+
+from __future__ import annotations
+
+import argparse, json, os, platform, subprocess, sys, tempfile, time
+from datetime import datetime, timezone
+from typing import Final, Iterator
+
+ROOT: Final[str] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.corpora import PATTERNS, SELECTIVITIES, corpus
+
+# Search paths measured on every corpus type.
+PATHS: Final[dict[str, tuple]] = {
+    'txt': ('fl_parser', 'query_wrapper'),
+    'fasta': ('fl_parser', 'fasta_engine'),
+    'csv': ('fl_parser', 'query_wrapper'),
+    'tsv': ('fl_parser', 'query_wrapper'),
+}
+DB_PATHS: Final[tuple] = ('sqlite_ingest', 'sqlite_invoker')
+
+def _peak_rss_mb() -> float | None:
+    """Peak resident set size of the current process.
+
+    Returns:
+        `float | None`: Peak RSS in MB, None where the resource module is not available.
+    """
+
+    try:
+        import resource
+    except ImportError:     # Windows.
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / 1024 ** (2 if sys.platform == 'darwin' else 1), 2)     # Bytes on macOS, KB elsewhere.
+
+def _search_iter(path: str, fl: str, pattern: str) -> Iterator:
+    """Lazy iterator over the matches of a search path.
+
+    Args:
+        * `path` (str): Search path.
+        * `fl` (str): Corpus file.
+        * `pattern` (str): Pattern.
+
+    Returns:
+        `Iterator`: Matches.
+    """
+
+    if path == 'fl_parser':
+        from lib.search_tool import search_tools
+        return search_tools._fl_parser(fl = fl, pat = pattern)
+    if path == 'fasta_engine':
+        from lib.fasta import fasta_engine
+        return fasta_engine(fl = fl, patterns = [pattern])._search()
+    raise ValueError(f'Unknown search path {path}.')
+
+def _run_case(case: dict) -> dict:
+    """Measure a single case, in the current process.
+
+    Args:
+        * `case` (dict): Case, with the path, corpus file, pattern and, for database paths, the output directory.
+
+    Returns:
+        `dict`: Measurements of the case.
+    """
+
+    path, fl, pattern = case['path'], case['fl'], case['pattern']
+    size = os.path.getsize(fl)
+    result = {'matches': 0, 'first_match_s': None}
+    if fl.endswith(('.csv', '.tsv')):
+        import numpy, pandas    # Imported lazily by the spreadsheet engine, keep the import time out of the measurement.
+
+    if path in DB_PATHS:
+        from lib.search_tool import search_tools
+        from lib.json_db import json_db
+        records = list(search_tools(fl = fl, pattern = pattern)._iter_records())
+        sink = json_db(db_type = 'sqlite', jsonf = os.path.join(case['out'], f'bench_{path}.json'), patterns = [pattern])
+        if path == 'sqlite_invoker':
+            from lib.records import _assemble
+            with open(sink.jsonf, 'w') as f:
+                json.dump(_assemble(records = records), f)
+        start = time.perf_counter()
+        if path == 'sqlite_ingest':
+            sink.ingest(rows = iter(records), out = case['out'], sources = [fl])
+        else:
+            sink.invoker(out = case['out'])
+        seconds = time.perf_counter() - start
+        result.update(matches = len(records), seconds = seconds, rows_s = round(len(records) / seconds, 1))
+
+    elif path == 'query_wrapper':
+        from lib.query_parser import query_tool     # Keep the import time out of the measurement.
+        from lib.exceptions import RegexError
+        start = time.perf_counter()
+        query = query_tool(fl = fl, pattern = pattern)
+        try:
+            query.query_wrapper(show_idx = False)
+        except RegexError:
+            pass
+        seconds = time.perf_counter() - start
+        # The results dictionary is only returned once the whole file is parsed.
+        result.update(matches = len(query.matches), seconds = seconds, first_match_s = seconds if query.matches else None)
+
+    else:
+        import lib.search_tool, lib.fasta      # Keep the import time out of the measurement.
+        start = time.perf_counter()
+        n = 0
+        for _ in _search_iter(path = path, fl = fl, pattern = pattern):
+            if not n:
+                result['first_match_s'] = round(time.perf_counter() - start, 6)
+            n += 1
+        seconds = time.perf_counter() - start
+        result.update(matches = n, seconds = seconds)
+
+    result['seconds'] = round(result['seconds'], 6)
+    result['mb_s'] = round(size / 1024 ** 2 / result['seconds'], 2) if result['seconds'] else None
+    result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+def _spawn(case: dict) -> dict:
+    """Measure a case in a fresh process.
+
+    Args:
+        * `case` (dict): Case, see _run_case.
+
+    Returns:
+        `dict`: Measurements of the case.
+    """
+
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '-case', json.dumps(case)],
+                         cwd = ROOT, capture_output = True, text = True)
+    if out.returncode:
+        raise RuntimeError(f"Case {case['name']} failed:\n{out.stderr}")
+    return json.loads(out.stdout)
+
+def _cases(sizes: list[float], kinds: list[str], seed: int, corpus_dir: str, out: str) -> Iterator[dict]:
+    """Generate the cases of the suite, creating the corpora on the way.
+
+    Args:
+        * `sizes` (list[float]): Corpus sizes in MB.
+        * `kinds` (list[str]): Corpus types.
+        * `seed` (int): Seed of the corpora.
+        * `corpus_dir` (str): Directory of the corpora.
+        * `out` (str): Scratch directory of the database paths.
+
+    Yields:
+        `dict`: Case.
+    """
+
+    for size in sizes:
+        for kind in kinds:
+            fl = corpus(kind = kind, size_mb = size, seed = seed, directory = corpus_dir)
+            for path in PATHS[kind]:
+                for sel in SELECTIVITIES:
+                    yield {'name': f'{kind}/{path}/{sel}/{size:g}mb', 'kind': kind, 'path': path, 'selectivity': sel,
+                           'size_mb': size, 'fl': fl, 'pattern': PATTERNS[kind][sel]}
+        if 'txt' in kinds:
+            fl = corpus(kind = 'txt', size_mb = size, seed = seed, directory = corpus_dir)
+            for path in DB_PATHS:
+                yield {'name': f'db/{path}/dense/{size:g}mb', 'kind': 'txt', 'path': path, 'selectivity': 'dense',
+                       'size_mb': size, 'fl': fl, 'pattern': PATTERNS['txt']['dense'], 'out': out}
+
+def _meta(args: argparse.Namespace) -> dict:
+    """Describe the environment of a run, so that runs can be compared over time.
+
+    Args:
+        * `args` (argparse.Namespace): Arguments of the run.
+
+    Returns:
+        `dict`: Metadata of the run.
+    """
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd = ROOT, capture_output = True, text = True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'timestamp': datetime.now(timezone.utc).isoformat(timespec = 'seconds'), 'commit': commit,
+            'python': sys.version.split()[0], 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'seed': args.seed, 'sizes_mb': args.sizes, 'repeat': args.repeat}
+
+def _compare(results: list[dict], baseline: str) -> None:
+    """Print the speedup of every case over a previous run.
+
+    Args:
+        * `results` (list[dict]): Results of this run.
+        * `baseline` (str): .json results file of a previous run.
+    """
+
+    with open(baseline) as f:
+        before = {r['name']: r for r in json.load(f)['results']}
+    for r in results:
+        b = before.get(r['name'])
+        if b is None or not r['seconds']:
+            continue
+        print(f"{r['name']:<40} {b['seconds']:>10.4f}s -> {r['seconds']:>10.4f}s  x{b['seconds'] / r['seconds']:.2f}", file = sys.stderr)
+
+def main() -> int:
+    PARSER = argparse.ArgumentParser(description = "Benchmark suite of the search and database paths, on synthetic corpora.")
+    PARSER.add_argument("-sizes", type = float, nargs = '+', default = [1, 16], help = "Corpus sizes in MB. Default is 1 16.")
+    PARSER.add_argument("-kinds", nargs = '+', choices = list(PATHS), default = list(PATHS), help = "Corpus types. Default is all of them.")
+    PARSER.add_argument("-seed", type = int, default = 0, help = "Seed of the corpora. Default is 0.")
+    PARSER.add_argument("-repeat", type = int, default = 3, help = "Runs of every case, the median time is kept. Default is 3.")
+    PARSER.add_argument("-corpus_dir", default = os.path.join(tempfile.gettempdir(), 'query-tool-bench'), help = "Directory of the generated corpora, reused between runs.")
+    PARSER.add_argument("-o", help = "Optional argument: Write the results into this .json file, otherwise they are printed.")
+    PARSER.add_argument("-compare", help = "Optional argument: .json results file of a previous run to compare against.")
+    PARSER.add_argument("-case", help = argparse.SUPPRESS)     # Internal: run a single case in this process.
+    ARGS = PARSER.parse_args()
+
+    if ARGS.case:
+        print(json.dumps(_run_case(case = json.loads(ARGS.case))))
+        return 0
+
+    results = []
+    with tempfile.TemporaryDirectory() as out:
+        for case in _cases(sizes = ARGS.sizes, kinds = ARGS.kinds, seed = ARGS.seed, corpus_dir = ARGS.corpus_dir, out = out):
+            runs = []
+            for _ in range(ARGS.repeat):
+                for db in os.listdir(out):
+                    os.remove(os.path.join(out, db))
+                runs.append(_spawn(case = case))
+            best = sorted(runs, key = lambda r: r['seconds'])[len(runs) // 2]
+            row = {k: v for k, v in case.items() if k not in ('fl', 'out')}
+            row.update(best)
+            row['peak_rss_mb'] = max((r['peak_rss_mb'] for r in runs if r['peak_rss_mb'] is not None), default = None)
+            row['seconds_all'] = [r['seconds'] for r in runs]
+            results.append(row)
+            print(f"{case['name']:<40} {row['seconds']:>10.4f}s  {row['matches']:>9} matches", file = sys.stderr)
+
+    report = {'meta': _meta(args = ARGS), 'results': results}
+    if ARGS.o:
+        with open(ARGS.o, 'w') as f:
+            json.dump(report, f, indent = 2)
+    else:
+        print(json.dumps(report, indent = 2))
+    if ARGS.compare:
+        _compare(results = results, baseline = ARGS.compare)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import os, re, glob
+from functools import partial
+from typing import Iterator
+from lib.query_parser import query_tool
+from lib.cache import result_cache
+from lib.compression import _base_name
+from lib.records import match_record, _assemble
+from lib.follow import tail_engine, checkpoint_store
+from lib.exceptions import RegexError, InputflError
+from lib.utils import dunders
+
+def _expand_inputs(inputs: list[str], exts: tuple) -> list[str]:
+    """Expand a list of files, directories and glob patterns into a list of files.
+    Directories are walked recursively and only files with a supported extension are kept from them,
+    compressed files included, e.g. .txt.gz for .txt.
+
+    Args:
+        * `inputs` (list[str]): Files, directories or glob patterns.
+        * `exts` (tuple): Supported file extensions.
+
+    Raises:
+        `InputflError`: An input file or directory does not exist.
+
+    Returns:
+        `list[str]`: Files to query, in input order and without duplicates.
+    """
+
+    fls = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, files in os.walk(item):
+                dirs.sort()
+                fls.extend(os.path.join(root, f) for f in sorted(files) if _base_name(fl = f).endswith(exts))
+        elif any(c in item for c in '*?['):
+            fls.extend(f for f in sorted(glob.glob(item, recursive = True)) if _base_name(fl = f).endswith(exts))
+        elif os.path.isfile(item):
+            fls.append(item)
+        else:
+            raise InputflError(f'Input file: {item} does not exist.')
+
+    return list(dict.fromkeys(fls))
+
+def _query_one(fl: str, pattern: str, chunksize: int | None = None, patterns: list[str] | None = None,
+               cache: result_cache | None = None, fasta: bool = False, revcomp: bool = False,
+               tail: tail_engine | None = None, fixed: bool = False) -> tuple[str, list[match_record], bool, tail_engine | None]:
+    """Run a query on a single file. Module level function, so that it can be sent to worker processes.
+
+    Args:
+        * `fl` (str): Input file.
+        * `pattern` (str): Input pattern.
+        * `chunksize` (int | None, optional): Number of rows per block for .csv/.tsv files. Defaults to None.
+        * `patterns` (list[str] | None, optional): Additional patterns, matched in the same pass. Defaults to None.
+        * `cache` (result_cache | None, optional): Cache of query results. Defaults to None.
+        * `fasta` (bool, optional): Search FASTA files record by record. Defaults to False.
+        * `revcomp` (bool, optional): In FASTA mode, also search the reverse complement of the sequences. Defaults to False.
+        * `tail` (tail_engine | None, optional): Incremental scan of the file. Defaults to None.
+        * `fixed` (bool, optional): Match the patterns as plain strings. Defaults to False.
+
+    Returns:
+        `tuple[str, list[match_record], bool, tail_engine | None]`: The file, its match records, whether they came
+                                                                    from the cache and the incremental scan, moved to
+                                                                    the end of the file. Files without matches get an empty list.
+    """
+
+    query = query_tool(fl = fl, pattern = pattern, chunksize = chunksize, patterns = patterns, cache = cache,
+                       fasta = fasta, revcomp = revcomp, tail = tail, fixed = fixed)
+    try:
+        query.query_wrapper(show_idx = False)
+    except RegexError:
+        return fl, [], False, query.tail
+    return fl, query.matches, query.cache_hit, query.tail
+
+def _query_tail(fl: str, tail: tail_engine | None, query: partial) -> tuple[str, list[match_record], bool, tail_engine | None]:
+    """Run a query, with the other arguments of _query_one bound, on a file and its incremental scan.
+    Module level function, so that it can be sent to worker processes.
+
+    Args:
+        * `fl` (str): Input file.
+        * `tail` (tail_engine | None): Incremental scan of the file.
+        * `query` (partial): _query_one with its other arguments bound as keywords.
+
+    Returns:
+        `tuple[str, list[match_record], bool, tail_engine | None]`: See _query_one.
+    """
+
+    return query(fl, tail = tail)
+
+class batch_query(dunders):
+    """Run the same query over many files, spread across a pool of worker processes.
+    Interpreter startup and imports are paid once per worker instead of once per file.
+
+    Args:
+        * `fls` (list[str]): Input files, directories or glob patterns.
+        * `pattern` (str): Input pattern.
+        * `workers` (int | None, optional): Number of worker processes. Defaults to None, one per core.
+        * `chunksize` (int | None, optional): Number of rows per block for .csv/.tsv files. Defaults to None.
+        * `patterns` (list[str] | None, optional): Additional patterns, matched in the same pass. Defaults to None.
+        * `cache` (result_cache | None, optional): Cache of query results. Its hit and miss counters are updated
+                                                   with the lookups of all workers. Defaults to None.
+        * `fasta` (bool, optional): Search FASTA files record by record. Defaults to False.
+        * `revcomp` (bool, optional): In FASTA mode, also search the reverse complement of the sequences. Defaults to False.
+        * `checkpoints` (checkpoint_store | None, optional): Checkpoints of incremental scans. Text files are only scanned
+                                                             from their checkpoint on, and their checkpoints are moved
+                                                             forward, to be saved by the caller. Defaults to None.
+        * `fixed` (bool, optional): Match the patterns as plain strings. Defaults to False.
+    """
+
+    def __init__(self, fls: list[str], pattern: str, workers: int | None = None, chunksize: int | None = None,
+                patterns: list[str] | None = None, cache: result_cache | None = None, fasta: bool = False,
+                revcomp: bool = False, checkpoints: checkpoint_store | None = None, fixed: bool = False) -> None:
+        self.fls = _expand_inputs(inputs = fls, exts = query_tool.txt_ext + query_tool.sp_ext)
+        self.pattern = pattern
+        self.workers = workers or os.cpu_count() or 1
+        self.chunksize = chunksize
+        self.patterns = patterns
+        self.cache = cache
+        self.fasta = fasta
+        self.revcomp = revcomp
+        self.checkpoints = checkpoints
+        self.fixed = fixed
+        self.matches = []
+        super().__init__()
+
+    def _iter_results(self) -> Iterator[tuple[str, list[match_record]]]:
+        """Query all the files, yielding the match records of every file as soon as they are available, in input order.
+
+        Yields:
+            `tuple[str, list[match_record]]`: Input file and its match records.
+        """
+
+        n = len(self.fls)
+        query_one = partial(_query_one, pattern = self.pattern, chunksize = self.chunksize, patterns = self.patterns,
+                            cache = self.cache, fasta = self.fasta, revcomp = self.revcomp, fixed = self.fixed)
+        pats = ([self.pattern] if self.pattern else []) + list(self.patterns or [])
+        if self.fixed:  # Checkpoints are kept per scanned pattern, apart from the regexes of the same strings.
+            pats = [re.escape(p) for p in pats]
+        tails = [self.checkpoints._tail(fl = fl, patterns = pats) if self.checkpoints is not None else None
+                 for fl in self.fls]
+        if n < 2 or self.workers < 2:
+            # Serial runs share the cache object, its counters are updated in place.
+            for fl, tail in zip(self.fls, tails):
+                fl, matches, _, tail = query_one(fl, tail = tail)
+                if tail is not None:
+                    self.checkpoints._put(patterns = pats, tail = tail)
+                yield fl, matches
+            return
+
+        workers = min(self.workers, n)
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers = workers) as pool:
+            results = pool.map(partial(_query_tail, query = query_one), self.fls, tails,
+                               chunksize = max(1, n // (workers * 4)))
+            for fl, matches, hit, tail in results:
+                if self.cache is not None:
+                    if hit:
+                        self.cache.hits += 1
+                    else:
+                        self.cache.misses += 1
+                if tail is not None:
+                    self.checkpoints._put(patterns = pats, tail = tail)
+                yield fl, matches
+
+    def _iter_records(self) -> Iterator[match_record]:
+        """Query all the files, yielding match records as the results of every file become available, e.g. for a database sink.
+
+        Yields:
+            `match_record`: Match record.
+        """
+
+        for _, records in self._iter_results():
+            yield from records
+
+    def run(self) -> dict:
+        """Query all the files. The match records of all the files are kept in the matches attribute.
+
+        Returns:
+            `dict`: Keys are the input files and values are the query results of each file.
+        """
+
+        out = {}
+        self.matches = []
+        for fl, records in self._iter_results():
+            self.matches.extend(records)
+            out[fl] = _assemble(records = records, multi_pattern = bool(self.patterns))
+        return out
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import os, json, hashlib
+from collections import OrderedDict
+from typing import Any, Callable
+from lib.utils import dunders
+
+class result_cache(dunders):
+    """Content addressed cache of query results, kept in an in-process LRU and optionally on disk.
+
+    Entries are keyed on the fingerprint of the queried file (path, size, modification time and optionally
+    a hash of its contents) plus the pattern and options of the query, so a changed file never hits a stale entry.
+    The in-process LRU holds up to max_entries results and the disk cache is capped at max_bytes,
+    evicting the least recently used entries first.
+
+    Args:
+        * `cache_dir` (str | None, optional): Directory of the disk cache. Defaults to None, in-process cache only.
+        * `max_bytes` (int, optional): Size cap of the disk cache in bytes. Defaults to 256 MiB.
+        * `max_entries` (int, optional): Number of results kept in the in-process LRU. Defaults to 128.
+        * `hash_contents` (bool, optional): Add a hash of the file contents to the fingerprint. Defaults to False.
+    """
+
+    default_dir = os.path.join(os.path.expanduser('~'), '.cache', 'query-tool')
+
+    def __init__(self, cache_dir: str | None = None, max_bytes: int = 256 * 1024 ** 2, max_entries: int = 128,
+                hash_contents: bool = False) -> None:
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hash_contents = hash_contents
+        self.mem = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok = True)
+        super().__init__()
+
+    @staticmethod
+    def _hash_file(fl: str) -> str:
+        """Hash the contents of a file.
+
+        Args:
+            * `fl` (str): File name/path.
+
+        Returns:
+            `str`: sha256 hex digest.
+        """
+
+        h = hashlib.sha256()
+        with open(fl, "rb") as f:
+            for block in iter(lambda: f.read(1024 ** 2), b''):
+                h.update(block)
+        return h.hexdigest()
+
+    def _key(self, fl: str, pattern: str, options: dict | None = None) -> str:
+        """Build the cache key of a query.
+
+        Args:
+            * `fl` (str): Queried file.
+            * `pattern` (str): Pattern.
+            * `options` (dict | None, optional): Other options that change the results. Defaults to None.
+
+        Returns:
+            `str`: sha256 hex digest of the fingerprint of the file and the query.
+        """
+
+        st = os.stat(fl)
+        parts = [os.path.abspath(fl), st.st_size, st.st_mtime_ns, pattern, options or {}]
+        if self.hash_contents:
+            parts.append(self._hash_file(fl = fl))
+        return hashlib.sha256(json.dumps(parts, sort_keys = True).encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        """Disk cache file of a key.
+
+        Args:
+            * `key` (str): Cache key.
+
+        Returns:
+            `str`: File name/path.
+        """
+
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def _get(self, key: str) -> dict | None:
+        """Look a query up, first in the in-process LRU, then on disk.
+
+        Args:
+            * `key` (str): Cache key.
+
+        Returns:
+            `dict | None`: Cached results, None on a miss.
+        """
+
+        if key in self.mem:
+            self.mem.move_to_end(key)
+            self.hits += 1
+            return self.mem[key]
+
+        if self.cache_dir:
+            try:
+                with open(self._path(key = key)) as f:
+                    value = json.load(f)
+                os.utime(self._path(key = key))     # Mark as recently used for the disk eviction.
+            except (OSError, ValueError):
+                pass
+            else:
+                self._mem_put(key = key, value = value)
+                self.hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def _mem_put(self, key: str, value: dict) -> None:
+        """Store results in the in-process LRU, evicting the least recently used entry when full.
+
+        Args:
+            * `key` (str): Cache key.
+            * `value` (dict): Query results.
+        """
+
+        self.mem[key] = value
+        self.mem.move_to_end(key)
+        while len(self.mem) > self.max_entries:
+            self.mem.popitem(last = False)
+
+    def _put(self, key: str, value: dict) -> None:
+        """Store the results of a query.
+
+        Args:
+            * `key` (str): Cache key.
+            * `value` (dict): Query results.
+        """
+
+        self._mem_put(key = key, value = value)
+        if not self.cache_dir:
+            return
+
+        path = self._path(key = key)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(value, f)
+        os.replace(tmp, path)
+        self._evict()
+
+    def _evict(self) -> None:
+        """Remove the least recently used entries of the disk cache until it fits in max_bytes."""
+
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith('.json'):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+
+        total = sum(e[1] for e in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:     # Removed by another process.
+                pass
+            total -= size
+
+    def _stats(self) -> dict[str, int]:
+        """Hit and miss counters of the cache.
+
+        Returns:
+            `dict[str, int]`: Number of hits and misses.
+        """
+
+        return {'hits': self.hits, 'misses': self.misses}
+
+class frame_cache(dunders):
+    """Thread safe in-process LRU of parsed spreadsheet files, for long running processes that query the same
+    spreadsheets again and again, e.g. the query server. Entries are keyed on the path, size and modification
+    time of the file, so a changed file is parsed again.
+
+    Args:
+        * `max_entries` (int, optional): Number of parsed files kept. Defaults to 16.
+    """
+
+    def __init__(self, max_entries: int = 16) -> None:
+        import threading
+        self.max_entries = max_entries
+        self.mem = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        super().__init__()
+
+    def _load(self, fl: str, read: Callable[[], Any]) -> Any:
+        """Get the parsed contents of a file, parsing it on a miss.
+
+        Args:
+            * `fl` (str): File name/path.
+            * `read` (Callable[[], Any]): Parser of the file, e.g. a pandas.read_csv call.
+
+        Returns:
+            `Any`: Parsed contents, shared between callers, which must not modify them.
+        """
+
+        st = os.stat(fl)
+        key = (os.path.abspath(fl), st.st_size, st.st_mtime_ns)
+        with self.lock:
+            if key in self.mem:
+                self.mem.move_to_end(key)
+                self.hits += 1
+                return self.mem[key]
+            self.misses += 1
+
+        value = read()      # Parsed outside the lock, concurrent misses on the same file may both parse it.
+        with self.lock:
+            self.mem[key] = value
+            self.mem.move_to_end(key)
+            while len(self.mem) > self.max_entries:
+                self.mem.popitem(last = False)
+        return value
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import os, json, socket, tempfile
+from lib.exceptions import RegexError, InputflError
+from lib.utils import dunders
+
+class query_client(dunders):
+    """Thin client of a query_server. It only needs the standard library, so forwarding a query costs a socket
+    round trip instead of the imports and parsing of a full run. Used as a context manager, the connection is
+    kept open for any number of queries:
+
+        >>> with query_client() as client:
+        ...     out = client.query(fls = ['log.txt'], pattern = 'error')
+
+    Args:
+        * `path` (str | None, optional): Socket file name/path of the server. Defaults to None, default_path.
+        * `timeout` (float | None, optional): Seconds to wait for a response. Defaults to None, no limit.
+    """
+
+    default_path = os.path.join(tempfile.gettempdir(), f'query-tool-{os.getuid()}.sock')
+    errors = {'RegexError': RegexError, 'InputflError': InputflError}
+
+    def __init__(self, path: str | None = None, timeout: float | None = None) -> None:
+        self.path = path or self.default_path
+        self.timeout = timeout
+        self.sock = None
+        self.f = None
+        super().__init__()
+
+    def __enter__(self) -> query_client:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+        self.f = self.sock.makefile('rb')
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.f.close()
+        self.sock.close()
+
+    def _request(self, req: dict) -> dict:
+        """Send a request and wait for its response.
+
+        Args:
+            * `req` (dict): Request, see query_server.
+
+        Raises:
+            RegexError, InputflError: Raised by the query on the server.
+            RuntimeError: Any other failure of the request on the server.
+
+        Returns:
+            `dict`: Response.
+        """
+
+        self.sock.sendall(json.dumps(req).encode('utf-8') + b'\n')
+        line = self.f.readline()
+        if not line:
+            raise ConnectionError(f'The query server at {self.path} closed the connection.')
+        resp = json.loads(line)
+        if not resp['ok']:
+            raise self.errors.get(resp['error'], RuntimeError)(resp['message'])
+        return resp
+
+    def query(self, fls: list[str], pattern: str, patterns: list[str] | None = None, chunksize: int | None = None,
+              fasta: bool = False, revcomp: bool = False, fixed: bool = False) -> list[dict]:
+        """Run a query on the server. Paths are sent as absolute paths, the server may run from another directory.
+
+        Args:
+            * `fls` (list[str]): Input files.
+            * `pattern` (str): Input pattern.
+            * `patterns` (list[str] | None, optional): Additional patterns, see query_tool. Defaults to None.
+            * `chunksize` (int | None, optional): Number of rows per block when reading .csv/.tsv files. Defaults to None.
+            * `fasta` (bool, optional): Search FASTA files record by record. Defaults to False.
+            * `revcomp` (bool, optional): In FASTA mode, also search the reverse complement. Defaults to False.
+            * `fixed` (bool, optional): Match the patterns as plain strings. Defaults to False.
+
+        Returns:
+            `list[dict]`: Query results of every file, as returned by query_tool.query_wrapper.
+        """
+
+        resp = self._request(req = {'op': 'query', 'fls': [os.path.abspath(fl) for fl in fls], 'pattern': pattern,
+                                    'patterns': patterns, 'chunksize': chunksize, 'fasta': fasta, 'revcomp': revcomp,
+                                    'fixed': fixed})
+        self.cache_hits = resp['cache_hits']
+        return resp['results']
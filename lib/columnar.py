@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+from typing import Iterable, Iterator
+from lib.records import match_record
+from lib.utils import dunders
+
+class columnar_writer(dunders):
+    """Columnar output of match records as a Parquet file or an Arrow IPC (Feather) file, with a typed schema.
+    Records are written in record batches as they are found, so memory use is bounded by the batch size.
+    Parquet files are zstd compressed and dictionary encoded, the smallest on disk. Arrow IPC files are left
+    uncompressed so that they can be memory mapped and loaded without copies, e.g. with pyarrow.ipc.open_file
+    or pandas.read_feather. Needs the pyarrow package.
+
+    Args:
+        * `fl` (str): Output file name/path, the extension of the format is added if missing.
+        * `fmt` (str, optional): Output format, 'parquet' or 'feather'. Defaults to 'parquet'.
+        * `batch_size` (int, optional): Number of records per record batch (Parquet row group). Defaults to 65536.
+    """
+
+    fmt_ext = {'parquet': '.parquet', 'feather': '.arrow'}
+
+    def __init__(self, fl: str, fmt: str = 'parquet', batch_size: int = 65536) -> None:
+        if fmt not in self.fmt_ext:
+            raise ValueError(f'Format {fmt} is not supported. Supported formats are: {", ".join(self.fmt_ext)}')
+        ext = self.fmt_ext[fmt]
+        self.fl = fl if fl.endswith(ext) else f'{fl}{ext}'
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.count = 0
+        super().__init__()
+
+    @staticmethod
+    def _schema():
+        """Arrow schema of the match records, in the field order of match_record.
+
+        Returns:
+            `pyarrow.Schema`: Schema.
+        """
+
+        import pyarrow as pa
+        return pa.schema([('source', pa.string()), ('pattern', pa.string()), ('line', pa.int64()),
+                          ('column', pa.string()), ('start', pa.int32()), ('end', pa.int32()),
+                          ('text', pa.string()), ('value', pa.string())])
+
+    def _open(self, schema):
+        """Open the output file.
+
+        Args:
+            * `schema` (pyarrow.Schema): Schema of the records.
+
+        Returns:
+            `pyarrow.parquet.ParquetWriter | pyarrow.ipc.RecordBatchFileWriter`: Writer of record batches.
+        """
+
+        if self.fmt == 'parquet':
+            import pyarrow.parquet as pq
+            return pq.ParquetWriter(self.fl, schema, compression = 'zstd')
+        import pyarrow.ipc as ipc
+        return ipc.new_file(self.fl, schema)
+
+    def _tee(self, records: Iterable[match_record]) -> Iterator[match_record]:
+        """Write match records while passing them on, e.g. to a database sink.
+
+        Args:
+            * `records` (Iterable[match_record]): Match records.
+
+        Yields:
+            `match_record`: The written match records.
+        """
+
+        import pyarrow as pa
+        schema = self._schema()
+
+        def flush(batch: list[match_record]) -> None:
+            cols = list(zip(*batch)) if batch else [()] * len(schema)
+            writer.write_batch(pa.RecordBatch.from_arrays([pa.array(c, type = f.type) for c, f in zip(cols, schema)],
+                                                          schema = schema))
+
+        batch = []
+        with self._open(schema = schema) as writer:
+            try:
+                for r in records:
+                    batch.append(r)
+                    if len(batch) >= self.batch_size:
+                        flush(batch)
+                        self.count += len(batch)
+                        batch = []
+                    yield r
+            finally:    # Pending records are also written when the stream is interrupted or closed early.
+                if batch or not self.count:     # An empty result still gets a readable file with its schema.
+                    flush(batch)
+                    self.count += len(batch)
+
+    def write(self, records: Iterable[match_record]) -> str:
+        """Write match records.
+
+        Args:
+            * `records` (Iterable[match_record]): Match records.
+
+        Returns:
+            `str`: Output file name/path.
+        """
+
+        for _ in self._tee(records = records):
+            pass
+        return self.fl
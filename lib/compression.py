@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import io, os
+from typing import IO
+
+comp_ext = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz', '.zst': 'zstd'}
+
+def _compression(fl: str) -> str | None:
+    """Get the compression of an input file from its extension.
+
+    Args:
+        * `fl` (str): File name/path.
+
+    Returns:
+        `str | None`: gzip, bz2, xz or zstd. None for uncompressed files.
+    """
+
+    return comp_ext.get(os.path.splitext(fl)[1].lower())
+
+def _base_name(fl: str) -> str:
+    """Strip the compression extension of a file name, so that the type of the file can be told from the
+    extension underneath, e.g. reads.fasta.gz is a .fasta file.
+
+    Args:
+        * `fl` (str): File name/path.
+
+    Returns:
+        `str`: File name/path without the compression extension.
+    """
+
+    root, ext = os.path.splitext(fl)
+    return root if ext.lower() in comp_ext else fl
+
+def _open_input(fl: str, mode: str = 'rb') -> IO:
+    """Open an input file for reading, decompressing it on the fly if its extension is a compression extension.
+    Nothing is decompressed to disk. zstd needs the zstandard package.
+
+    Args:
+        * `fl` (str): File name/path.
+        * `mode` (str, optional): 'rb' for bytes or 'r' for text. Defaults to 'rb'.
+
+    Returns:
+        `IO`: Readable stream.
+    """
+
+    comp = _compression(fl = fl)
+    text = 'b' not in mode
+    if comp is None:
+        return open(fl, mode)
+    if comp == 'gzip':
+        import gzip
+        stream = gzip.open(fl, 'rb')
+    elif comp == 'bz2':
+        import bz2
+        stream = bz2.open(fl, 'rb')
+    elif comp == 'xz':
+        import lzma
+        stream = lzma.open(fl, 'rb')
+    else:
+        import zstandard
+        # Multi-frame files, e.g. from pzstd or concatenated logs, are read to the end, not just their first frame.
+        stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(fl, 'rb'), closefd = True,
+                                                                              read_across_frames = True))
+    return io.TextIOWrapper(stream) if text else stream
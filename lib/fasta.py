@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import re
+from typing import Iterator
+from lib.records import match_record
+from lib.compression import _open_input
+from lib.patterns import pattern_set
+from lib.utils import dunders
+
+class fasta_engine(dunders):
+    """Record aware search of FASTA files. The file is streamed one record at a time: the wrapped sequence lines
+    of a record are joined in a reusable buffer, so matches spanning line breaks are found, and the sequence and
+    the header are searched separately. Memory use is bounded by the longest record, not by the file size.
+    Compressed files are decompressed on the fly. Several patterns are searched in a single pass over every
+    sequence, with their combined regex (see pattern_set).
+
+    Matches are reported by record, as match records with:
+        * `line`: Index of the record in the file.
+        * `column`: Location key, record id and sequence offset, e.g. chr1:1200. Reverse strand matches get a
+                    :- suffix and header matches are keyed by header offset, e.g. chr1:header:4.
+        * `start`, `end`: Offsets of the match in the sequence, on the forward strand, or in the header.
+        * `text`, `value`: Matched text, as read on the strand it matched. For header matches, value is the header.
+
+    Args:
+        * `fl` (str): FASTA file name/path.
+        * `patterns` (list[str]): Patterns to look for.
+        * `revcomp` (bool, optional): Also search the reverse complement of every sequence, in the same pass. Defaults to False.
+    """
+
+    _complement = bytes.maketrans(b'ACGTUWSRYKMBVDHNacgtuwsrykmbvdhn', b'TGCAAWSYRMKVBHDNtgcaawsyrmkvbhdn')
+
+    def __init__(self, fl: str, patterns: list[str], revcomp: bool = False) -> None:
+        self.fl = fl
+        self.patterns = patterns
+        self.revcomp = revcomp
+        super().__init__()
+
+    def _iter_fasta(self) -> Iterator[tuple[int, str, bytearray]]:
+        """Stream the records of the file. The sequence buffer is reused between records, so it is only valid
+        until the next record is requested.
+
+        Yields:
+            `tuple[int, str, bytearray]`: Record index, header without the leading > and sequence.
+        """
+
+        seq = bytearray()
+        header, index = None, -1
+        with _open_input(fl = self.fl) as f:
+            for line in f:
+                if line.startswith(b'>'):
+                    if header is not None or seq:
+                        yield index, header or '', seq
+                    header = line[1:].strip().decode('utf-8', errors = 'replace')
+                    index += 1
+                    seq.clear()
+                else:
+                    seq += line.strip()
+        if header is not None or seq:
+            yield index, header or '', seq
+
+    @staticmethod
+    def _finditer(text, combined: re.Pattern, compiled: list[tuple[str, re.Pattern]]) -> Iterator[tuple[str, re.Match]]:
+        """Find the matches of every pattern in a header or sequence, in a single pass. The combined regex finds the
+        next position at which any of the patterns matches, and only there are the patterns run, so every pattern
+        gets the matches of its own finditer, including those overlapping the matches of other patterns.
+
+        Args:
+            * `text` (str | bytearray): Header or sequence.
+            * `combined` (re.Pattern): Combined regex of the patterns, of the type of the text.
+            * `compiled` (list[tuple[str, re.Pattern]]): Patterns and their compiled regexes, of the type of the text.
+
+        Yields:
+            `tuple[str, re.Match]`: Pattern and match, in match order.
+        """
+
+        if len(compiled) == 1:
+            p, regex = compiled[0]
+            for m in regex.finditer(text):
+                yield p, m
+            return
+
+        nxt = [0] * len(compiled)   # Matches of a pattern do not overlap, its next one starts at its last end.
+        pos = 0
+        while (hit := combined.search(text, pos)) is not None:
+            at = hit.start()
+            for i, (p, regex) in enumerate(compiled):
+                if nxt[i] <= at and (m := regex.match(text, at)) is not None:
+                    nxt[i] = m.end() if m.end() > at else at + 1
+                    yield p, m
+            pos = max(at + 1, min(nxt))
+            if pos > len(text):
+                return
+
+    def _search(self) -> Iterator[match_record]:
+        """Search the headers and sequences of the file, and the reverse complements if requested.
+
+        Yields:
+            `match_record`: Match record.
+        """
+
+        combined = pattern_set(patterns = self.patterns).combined if len(self.patterns) > 1 else self.patterns[0]
+        regex, bregex = re.compile(combined), re.compile(combined.encode('utf-8'))
+        compiled = [(p, re.compile(p)) for p in self.patterns]
+        bcompiled = [(p, re.compile(p.encode('utf-8'))) for p in self.patterns]
+        for index, header, seq in self._iter_fasta():
+            rid = header.split(None, 1)[0] if header else ''
+            for p, m in self._finditer(header, regex, compiled):
+                yield match_record(self.fl, p, index, f'{rid}:header:{m.start()}', m.start(), m.end(), m.group(), header)
+            for p, m in self._finditer(seq, bregex, bcompiled):
+                text = m.group().decode('ascii', errors = 'replace')
+                yield match_record(self.fl, p, index, f'{rid}:{m.start()}', m.start(), m.end(), text, text)
+            if self.revcomp and seq:
+                rc = seq.translate(self._complement)
+                rc.reverse()
+                n = len(seq)
+                for p, m in self._finditer(rc, bregex, bcompiled):
+                    start, end = n - m.end(), n - m.start()
+                    text = m.group().decode('ascii', errors = 'replace')
+                    yield match_record(self.fl, p, index, f'{rid}:{start}:-', start, end, text, text)
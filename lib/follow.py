@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import os, re, json, time
+from typing import BinaryIO, Iterator
+from lib.utils import dunders
+
+class tail_engine(dunders):
+    """Incremental scan of a growing text file, e.g. a log file. The scan starts from a byte offset and line index,
+    only complete lines are consumed, and the position reached is kept in the offset and line attributes, so a
+    later scan picks up from there. The file is identified by its device and inode: a rotated (replaced) or
+    truncated file is scanned again from the start. Lines appended to a rotated file after its last scan are
+    only seen by the follow mode, which drains the old file before switching to the new one.
+
+    Args:
+        * `fl` (str): Text file name/path.
+        * `offset` (int, optional): Byte offset to start from. Defaults to 0.
+        * `line` (int, optional): Line index at offset. Defaults to 0.
+        * `ident` (list[int] | None, optional): Device and inode of the file at offset. Defaults to None, unchecked.
+    """
+
+    def __init__(self, fl: str, offset: int = 0, line: int = 0, ident: list[int] | None = None) -> None:
+        self.fl = fl
+        self.offset = offset
+        self.line = line
+        self.ident = ident
+        super().__init__()
+
+    def _open(self) -> BinaryIO:
+        """Open the file at the current position, starting over if the file was rotated or truncated.
+
+        Returns:
+            `BinaryIO`: File positioned at the offset attribute.
+        """
+
+        f = open(self.fl, "rb")
+        st = os.fstat(f.fileno())
+        ident = [st.st_dev, st.st_ino]
+        if (self.ident is not None and self.ident != ident) or st.st_size < self.offset:
+            self.offset, self.line = 0, 0
+        self.ident = ident
+        f.seek(self.offset)
+        return f
+
+    def _resumes(self) -> bool:
+        """Check, without moving the position, if a scan would pick up from the offset attribute rather than
+        start over, i.e. the file was neither rotated nor truncated since.
+
+        Returns:
+            `bool`: True if the lines before the offset attribute are skipped.
+        """
+
+        try:
+            st = os.stat(self.fl)
+        except FileNotFoundError:
+            return False
+        return self.offset > 0 and st.st_size >= self.offset and self.ident in (None, [st.st_dev, st.st_ino])
+
+    def _read(self, f: BinaryIO, regex: re.Pattern) -> Iterator[tuple[int, str]]:
+        """Match the complete lines from the current position of an open file. A trailing partial line is left
+        for the next read.
+
+        Args:
+            * `f` (BinaryIO): File, positioned at the offset attribute.
+            * `regex` (re.Pattern): Compiled pattern.
+
+        Yields:
+            `tuple[int, str]`: Line index and stripped line contents for every line matching the pattern.
+        """
+
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                f.seek(self.offset)
+                return
+            idx = self.line
+            self.offset += len(raw)
+            self.line += 1
+            line = raw.decode('utf-8', errors = 'replace').rstrip('\r\n')
+            if regex.search(line):
+                yield idx, line.strip()
+
+    def _scan(self, pat: str) -> Iterator[tuple[int, str]]:
+        """Scan the lines appended since the current position, once.
+
+        Args:
+            * `pat` (str): Pattern to look for.
+
+        Yields:
+            `tuple[int, str]`: Line index and stripped line contents for every line matching the pattern.
+        """
+
+        regex = re.compile(pat)
+        with self._open() as f:
+            yield from self._read(f = f, regex = regex)
+
+    def _follow(self, pat: str, interval: float = 0.5) -> Iterator[tuple[int, str]]:
+        """Scan the file like tail -f: match the lines appended since the current position, then keep polling
+        the file for new lines until the consumer stops. The pattern is compiled once.
+
+        Args:
+            * `pat` (str): Pattern to look for.
+            * `interval` (float, optional): Seconds between polls once the end of the file is reached. Defaults to 0.5.
+
+        Yields:
+            `tuple[int, str]`: Line index and stripped line contents for every line matching the pattern.
+        """
+
+        regex = re.compile(pat)
+        f = self._open()
+        try:
+            while True:
+                yield from self._read(f = f, regex = regex)
+                try:
+                    st = os.stat(self.fl)
+                except FileNotFoundError:   # Rotation in progress.
+                    st = None
+                if st is not None and ([st.st_dev, st.st_ino] != self.ident or st.st_size < self.offset):
+                    f.close()
+                    self.ident = None
+                    self.offset, self.line = 0, 0
+                    f = self._open()
+                    continue
+                time.sleep(interval)
+        finally:
+            f.close()
+
+class checkpoint_store(dunders):
+    """Checkpoints of incremental scans, kept in a .json file. For every file and set of patterns, the byte offset
+    and line index reached by the last run are stored together with the device and inode of the file, so a rerun
+    only scans the lines appended since then.
+
+    Args:
+        * `path` (str | None, optional): Checkpoint file. Defaults to None, ~/.cache/query-tool/checkpoints.json.
+    """
+
+    default_path = os.path.join(os.path.expanduser('~'), '.cache', 'query-tool', 'checkpoints.json')
+
+    def __init__(self, path: str | None = None) -> None:
+        self.path = path or self.default_path
+        try:
+            with open(self.path) as f:
+                self.points = json.load(f)
+        except (OSError, ValueError):
+            self.points = {}
+        super().__init__()
+
+    @staticmethod
+    def _key(fl: str, patterns: list[str]) -> str:
+        """Checkpoint key of a file and a set of patterns.
+
+        Args:
+            * `fl` (str): File name/path.
+            * `patterns` (list[str]): Patterns of the query.
+
+        Returns:
+            `str`: Key.
+        """
+
+        return json.dumps([os.path.abspath(fl), sorted(patterns)])
+
+    def _tail(self, fl: str, patterns: list[str]) -> tail_engine:
+        """Get an incremental scan of a file, resuming from its checkpoint if there is one.
+
+        Args:
+            * `fl` (str): File name/path.
+            * `patterns` (list[str]): Patterns of the query.
+
+        Returns:
+            `tail_engine`: Incremental scan.
+        """
+
+        point = self.points.get(self._key(fl = fl, patterns = patterns), {})
+        return tail_engine(fl = fl, offset = point.get('offset', 0), line = point.get('line', 0), ident = point.get('ident'))
+
+    def _put(self, patterns: list[str], tail: tail_engine) -> None:
+        """Record the position reached by an incremental scan.
+
+        Args:
+            * `patterns` (list[str]): Patterns of the query.
+            * `tail` (tail_engine): Incremental scan.
+        """
+
+        self.points[self._key(fl = tail.fl, patterns = patterns)] = {'offset': tail.offset, 'line': tail.line,
+                                                                      'ident': tail.ident}
+
+    def _save(self) -> str:
+        """Write the checkpoints to disk, atomically.
+
+        Returns:
+            `str`: Checkpoint file name/path.
+        """
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok = True)
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.points, f, indent = 2)
+        os.replace(tmp, self.path)
+        return self.path
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import os, re
+from array import array
+from typing import Iterator
+from lib.patterns import _required_literals, _prefilter
+from lib.mmap_engine import _block_lines
+from lib.utils import dunders
+
+class trigram_index(dunders):
+    """Persistent trigram inverted index of a text file, stored as a sqlite3 database next to the file.
+
+    The file is split into blocks of lines and every trigram (3 byte substring) is mapped to the blocks
+    holding it. A query extracts the literals that every match must contain and only scans the blocks that
+    hold all of their trigrams. The index is keyed on the path, size and modification time of the file,
+    so a stale index is detected and ignored.
+
+    Args:
+        * `fl` (str): Indexed file.
+        * `block_lines` (int, optional): Number of lines per block. Defaults to 64.
+    """
+
+    idx_ext = '.qidx'
+
+    def __init__(self, fl: str, block_lines: int = 64) -> None:
+        self.fl = fl
+        self.idx = f'{fl}{self.idx_ext}'
+        self.block_lines = block_lines
+        super().__init__()
+
+    def _fingerprint(self) -> dict[str, str]:
+        """Fingerprint of the indexed file.
+
+        Returns:
+            `dict[str, str]`: Absolute path, size and modification time of the file.
+        """
+
+        st = os.stat(self.fl)
+        return {'path': os.path.abspath(self.fl), 'size': str(st.st_size), 'mtime': str(st.st_mtime_ns)}
+
+    def _build(self) -> str:
+        """Build the index, replacing any existing index of the file.
+
+        Returns:
+            `str`: Index file name/path.
+        """
+
+        import sqlite3
+        fingerprint = self._fingerprint()
+        postings = {}
+        offsets = array('q')
+        lines = array('q')
+
+        with open(self.fl, "rb") as f:
+            block, offset, line_no = 0, 0, 0
+            while True:
+                chunk = [ln for _, ln in zip(range(self.block_lines), f)]
+                if not chunk:
+                    break
+                offsets.append(offset)
+                lines.append(line_no)
+                data = b''.join(chunk)
+                for gram in {data[i:i + 3] for i in range(len(data) - 2)}:
+                    postings.setdefault(gram, array('I')).append(block)
+                block += 1
+                offset += len(data)
+                line_no += len(chunk)
+
+        tmp = f'{self.idx}.tmp'
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        con = sqlite3.connect(tmp)
+        cur = con.cursor()
+        cur.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+        cur.execute('CREATE TABLE blocks (id INTEGER PRIMARY KEY, offset INTEGER, line INTEGER)')
+        cur.execute('CREATE TABLE grams (gram BLOB PRIMARY KEY, blocks BLOB) WITHOUT ROWID')
+        cur.executemany('INSERT INTO meta VALUES (?,?)', list(fingerprint.items()) + [('end', str(offset))])
+        cur.executemany('INSERT INTO blocks VALUES (?,?,?)', zip(range(len(offsets)), offsets, lines))
+        cur.executemany('INSERT INTO grams VALUES (?,?)', ((g, b.tobytes()) for g, b in postings.items()))
+        con.commit()
+        con.close()
+        os.replace(tmp, self.idx)
+        return self.idx
+
+    def _fresh(self) -> bool:
+        """Check if an index of the file exists and matches the current state of the file.
+
+        Returns:
+            `bool`: True if the index can be used.
+        """
+
+        if not os.path.isfile(self.idx):
+            return False
+        import sqlite3
+        con = sqlite3.connect(self.idx)
+        try:
+            meta = dict(con.execute('SELECT key, value FROM meta').fetchall())
+        except sqlite3.DatabaseError:
+            return False
+        finally:
+            con.close()
+        return all(meta.get(k) == v for k, v in self._fingerprint().items())
+
+    def _candidates(self, pat: str) -> list[tuple[int, int, int]] | None:
+        """Get the blocks that may hold a match of a pattern.
+
+        Args:
+            * `pat` (str): Pattern to look for.
+
+        Returns:
+            `list[tuple[int, int, int]] | None`: Start offset, end offset and first line index of every candidate block.
+                                                 None when the pattern has no literal of 3 characters or more to narrow on.
+        """
+
+        grams = set()
+        for lit in _required_literals(pat = pat):
+            lit = lit.encode('utf-8')
+            grams.update(lit[i:i + 3] for i in range(len(lit) - 2))
+        if not grams:
+            return None
+
+        import sqlite3
+        con = sqlite3.connect(self.idx)
+        try:
+            blocks = None
+            for gram in grams:
+                row = con.execute('SELECT blocks FROM grams WHERE gram = ?', (gram,)).fetchone()
+                if row is None:
+                    return []
+                ids = set(array('I', row[0]))
+                blocks = ids if blocks is None else blocks & ids
+                if not blocks:
+                    return []
+
+            end = int(con.execute("SELECT value FROM meta WHERE key = 'end'").fetchone()[0])
+            wanted = sorted(blocks | {b + 1 for b in blocks})
+            starts = {}
+            for i in range(0, len(wanted), 900):    # Stay below the sqlite3 host parameter limit.
+                ids = wanted[i:i + 900]
+                q = f"SELECT id, offset, line FROM blocks WHERE id IN ({','.join('?' * len(ids))})"
+                starts.update((r[0], (r[1], r[2])) for r in con.execute(q, ids))
+        finally:
+            con.close()
+
+        return [(starts[b][0], starts.get(b + 1, (end,))[0], starts[b][1]) for b in sorted(blocks)]
+
+    def _search(self, pat: str) -> Iterator[tuple[int, str]] | None:
+        """Search the file through the index. Only the candidate blocks are read and matched against the pattern.
+
+        Args:
+            * `pat` (str): Pattern to look for.
+
+        Returns:
+            `Iterator[tuple[int, str]] | None`: Generator yielding line index and stripped line contents for every match.
+                                                None when the index cannot narrow the search down for this pattern.
+        """
+
+        candidates = self._candidates(pat = pat)
+        if candidates is None:
+            return None
+        return self._scan_blocks(pat = pat, blocks = candidates)
+
+    def _scan_blocks(self, pat: str, blocks: list[tuple[int, int, int]]) -> Iterator[tuple[int, str]]:
+        """Scan a list of blocks of the file. Blocks are scanned for the literal of the pattern first, if any.
+
+        Args:
+            * `pat` (str): Pattern to look for.
+            * `blocks` (list[tuple[int, int, int]]): Start offset, end offset and first line index of every block.
+
+        Yields:
+            `tuple[int, str]`: Line index and stripped line contents for every line matching the pattern.
+        """
+
+        regex = re.compile(pat)
+        lit, exact = _prefilter(pat = pat)
+        with open(self.fl, "rb") as f:
+            for start, end, line_no in blocks:
+                f.seek(start)
+                text = f.read(end - start).decode('utf-8', errors = 'replace')
+                if lit is None:
+                    for i, line in enumerate(text.split('\n')):
+                        if regex.search(line.rstrip('\r')):     # CRLF lines are matched without their \r.
+                            yield line_no + i, line.strip()
+                    continue
+                for i, line in _block_lines(text, lit, None if exact else regex):
+                    yield line_no + i, line
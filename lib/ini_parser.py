@@ -2,8 +2,34 @@
 from __future__ import annotations
 
 import configparser
+from functools import lru_cache
 from lib.utils import dunders
 
+@lru_cache(maxsize = None)
+def _ini_cache(ini: str) -> tuple[tuple[str, str], ...]:
+    """Parse a .ini file once per process.
+
+    Args:
+        * `ini` (_str_): .ini file path/name.
+
+    Returns:
+        `tuple`: Immutable (key, value) pairs of the .ini file.
+    """
+
+    return tuple(ini_handler(ini = ini)._ini_to_dict().items())
+
+def _ini_settings(ini: str) -> dict:
+    """Cached contents of a .ini file, as returned by ini_handler._ini_to_dict. The file is parsed on the first call only.
+
+    Args:
+        * `ini` (_str_): .ini file path/name.
+
+    Returns:
+        `dict`: Copy of the cached contents of the .ini file.
+    """
+
+    return dict(_ini_cache(ini))
+
 class ini_handler(dunders):
     """.ini file handler.
 
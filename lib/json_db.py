@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
-import os, json
-import numpy as np
-import pandas as pd
+import os, re, json
+from itertools import islice
 from pathlib import Path
-from lib.ini_parser import ini_handler
+from typing import Iterable, Iterator
+from lib.ini_parser import _ini_settings
+from lib.records import match_record
+from lib.profiler import _stage, _tally
 from lib.utils import dunders
 from lib.exceptions import DBTypeError, InputflError
 
@@ -26,52 +28,222 @@ def _fl_nm_parser(flstr: str, f_type: str) -> str:
         nm = os.path.split(nm)[1]
     return nm
 
-def __json_df_parser(jfl: str) -> pd.DataFrame:
-    """Parses through a .json file and writes into a pandas dataframe.
+def _flatten(dictionary: dict) -> dict:
+    """Flatten nested query results, e.g. results of a multi-file query keyed by file or of a multi-pattern
+    query keyed by pattern, into a single level dictionary. Nested keys are prefixed with their parent keys.
 
     Args:
-        * `jfl` (str): .json file to parse.
+        * `dictionary` (dict): Query results.
 
     Returns:
-        pd.DataFrame: A pandas dataframe containing the keys of a .json as columns and the values as rows.
+        dict: Single level dictionary.
     """
 
-    with open(jfl) as f:
-        data = json.load(f)
-        data = dict((k.strip(), v.strip()) for k, v in data.items())    # Replace leading and trailing whitespace with ""
-    return pd.DataFrame(data, index=[0])
+    flat = {}
+    for k, v in dictionary.items():
+        if isinstance(v, dict):
+            for nk, nv in _flatten(dictionary = v).items():
+                flat[f'{k}:{nk.strip()}'] = nv
+        else:
+            flat[k] = v
+    return flat
 
-def _df_parser(jsonf: str) -> tuple[list, list]:
-    """.json to dataframe parser.
+def _json_rows(jsonf: str) -> Iterator[match_record]:
+    """Read the keys and values of a .json output file as database rows. The .json file is the source of the rows
+    and the flattened keys are kept as column names, since the query behind the file is unknown.
 
     Args:
         * `jsonf` (str): .json file to parse.
 
+    Yields:
+        `match_record`: Database row.
+    """
+
+    with _stage('json.read', nbytes = os.path.getsize(jsonf)), open(jsonf) as f:
+        data = _flatten(dictionary = json.load(f))
+    for k, v in data.items():
+        yield match_record(jsonf, '', -1, k.strip(), None, None, None, v.strip())
+
+def _fingerprint(fl: str) -> tuple[int, int]:
+    """Fingerprint of an input file, used to detect files that changed since the last run.
+
+    Args:
+        * `fl` (str): File name/path.
+
     Returns:
-        tuple[list, list]: Two lists containing all column names and row values as separate elements.
+        `tuple[int, int]`: Size and modification time (ns) of the file.
+    """
+
+    st = os.stat(fl)
+    return st.st_size, st.st_mtime_ns
+
+def _batches(rows: Iterable, size: int) -> Iterator[list]:
+    """Split an iterable into lists of up to size items, without materialising the iterable.
+
+    Args:
+        * `rows` (Iterable): Rows.
+        * `size` (int): Rows per batch.
+
+    Yields:
+        `list`: Batch of rows.
     """
 
-    df = __json_df_parser(jfl = jsonf)
-    cols = list(df.columns)
-    rows = list(df.values)  # numpy array.
-    rows = np.array(rows).tolist()[0]
-    return cols, rows
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+class pg_pool(dunders):
+    """Postgres connection pool shared by the database sinks of a run. Connection settings are read once
+    from the .ini file, the database is created at most once, and the tables created through the pool are
+    tracked, so a batch of many files pays the connection handshake and the setup statements only once.
+
+    Args:
+        * `ini` (str): Name of .ini file for postgres parsing.
+        * `minconn` (int, optional): Connections opened up front. Defaults to 1.
+        * `maxconn` (int, optional): Maximum number of connections. Defaults to 4.
+        * `connect` (Callable | None, optional): Connection factory taking psycopg2.connect keyword arguments,
+                                                 e.g. a stand-in for testing. Defaults to None, psycopg2.connect.
+        * `pool_factory` (Callable | None, optional): Pool factory taking (minconn, maxconn, **connect kwargs) and returning
+                                                      an object with getconn, putconn and closeall methods.
+                                                      Defaults to None, psycopg2.pool.ThreadedConnectionPool.
+
+    Rows are still inserted with psycopg2.extras.execute_values and execute_batch, so the connections of a stand-in
+    pool need an encoding attribute (e.g. UTF8) and cursors with execute and mogrify methods, mogrify returning bytes.
+
+    Raises:
+        `InputflError`: The .ini file does not exist.
+    """
+
+    def __init__(self, ini: str, minconn: int = 1, maxconn: int = 4, connect = None, pool_factory = None) -> None:
+        if not os.path.isfile(ini):
+            raise InputflError(f'.ini file: {ini} does not exist.')
+        settings = _ini_settings(ini = ini)
+        self.database = settings['database']
+        self.params = {'user': settings['pguser'], 'password': settings['pgpswd'],
+                       'host': settings['pghost'], 'port': settings['pgport']}
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.connect = connect
+        self.pool_factory = pool_factory
+        self.pool = None
+        self.db_ready = False
+        self.tables = set()
+        super().__init__()
+
+    def _admin(self):
+        """Open a connection to the server without selecting the database, for creating the database.
+
+        Returns:
+            `connection`: Autocommit connection.
+        """
+
+        if self.connect is None:
+            import psycopg2
+            self.connect = psycopg2.connect
+        conn = self.connect(dbname = 'postgres', **self.params)
+        conn.autocommit = True
+        return conn
+
+    def _db_exists(self) -> bool:
+        """Check if the database exists.
+
+        Returns:
+            `bool`: True if the database exists.
+        """
+
+        if self.db_ready:
+            return True
+        conn = self._admin()
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1 FROM pg_database WHERE datname = %s', (self.database,))
+            return cur.fetchone() is not None
+        finally:
+            conn.close()
+
+    def _ensure_db(self, reuse: bool) -> None:
+        """Create the database, once per pool.
+
+        Args:
+            * `reuse` (bool): Reuse the database if it exists. Otherwise creating an existing database fails.
+        """
+
+        if self.db_ready:
+            return
+        if not (reuse and self._db_exists()):
+            conn = self._admin()
+            try:
+                conn.cursor().execute(f'''CREATE database {self.database}''')
+            finally:
+                conn.close()
+        self.db_ready = True
+
+    def _get(self):
+        """Take a connection to the database from the pool, opening the pool on first use.
+
+        Returns:
+            `connection`: Database connection.
+        """
+
+        if self.pool is None:
+            factory = self.pool_factory
+            if factory is None:
+                from psycopg2.pool import ThreadedConnectionPool
+                factory = ThreadedConnectionPool
+            self.pool = factory(self.minconn, self.maxconn, dbname = self.database, **self.params)
+        return self.pool.getconn()
+
+    def _put(self, conn) -> None:
+        """Return a connection to the pool.
+
+        Args:
+            * `conn` (connection): Database connection.
+        """
+
+        self.pool.putconn(conn)
+
+    def close(self) -> None:
+        """Close all the connections of the pool."""
+
+        if self.pool is not None:
+            self.pool.closeall()
+            self.pool = None
 
 class json_db(dunders):
-    """Convert .json file to database file. sqlite3 and postgres4 are the supported sql distributions.
+    """Write query results to a database. sqlite3 and postgres4 are the supported sql distributions.
+
+    Rows are either read from a .json output file (invoker method) or streamed straight from the search
+    generators (ingest method). Either way, they are inserted in batches within a single transaction.
+
+    Every row holds its source file, pattern, line (or row) index, column name, match offsets, matched text and
+    the whole matched line or cell. Rows are unique on (source file, pattern, line, column), which is also the
+    B-tree index for lookups by file, and further indexes cover lookups by pattern and by line. A second table records the size and modification time of every ingested
+    file. In append mode, an existing database and table are reused, matches are upserted and only the files
+    whose fingerprint changed since the last run need to be queried (see the _changed method).
 
     Args:
-        * `db_type` (str): _description_
-        * `jsonf` (str): Name of .json file.
+        * `db_type` (str): Database engine, sqlite or postgres.
+        * `jsonf` (str): Name of .json file, or of the query output the database and table are named after.
         * `ini` (str, optional): Name of .ini file for postgres parsing. Defaults to None.
+        * `append` (bool, optional): Reuse an existing database and table. Defaults to False.
+        * `patterns` (list[str] | None, optional): Patterns of the query, as given. Fingerprints are recorded per pattern set.
+                                                   Defaults to None.
+        * `fixed` (bool, optional): The patterns are plain strings. Their rows are keyed on the strings, their fingerprints
+                                    on the escaped strings, apart from regexes of the same strings. Defaults to False.
+        * `pool` (pg_pool | None, optional): Postgres connection pool, shared by all the sinks of a run.
+                                             Defaults to None, a pool is created on the first postgres write.
 
     Raises:
         `InputflError`: Input file does not exist.
     """
 
     db_supp_types = ("sqlite", "postgres")
+    batch_size = 10000  # Rows per insert batch.
 
-    def __init__(self, db_type, jsonf, ini = None) -> None:
+    def __init__(self, db_type, jsonf, ini = None, append = False, patterns = None, pool = None, fixed = False) -> None:
         self.db_type = db_type
         self.jsonf = jsonf
         self.ini = ini
@@ -79,82 +251,198 @@ class json_db(dunders):
             if not os.path.isfile(self.ini):
                 raise InputflError(f'.ini file: {self.ini} does not exist.')
 
+        self.append = append
+        self.pool = pool
+        self.patterns = [p for p in (patterns or []) if p] or ['']
+        self.query = '\n'.join(re.escape(p) for p in self.patterns) if fixed else '\n'.join(self.patterns)
         self.db_name = _fl_nm_parser(flstr = self.jsonf, f_type = "db")
+        self.table_name = f'{Path(self.jsonf).stem}_table'
         super().__init__()
 
-    @staticmethod
-    def _json_to_sqlite(jsonf: str, db_name: str) -> str:
-        """Convert .json file contents to a sqlite3 database.
+    def _statements(self, param: str) -> dict[str, str]:
+        """SQL statements shared by the database engines. For postgres, the insert statement takes all the rows
+        of a batch in a single VALUES %s list.
+
+        Args:
+            * `param` (str): Parameter placeholder of the engine.
+
+        Returns:
+            `dict[str, str]`: Statements by name.
+        """
+
+        t, p = self.table_name, param
+        exists = 'IF NOT EXISTS ' if self.append else ''
+        cols = 'source_file, pattern, line_no, column_name, start_offset, end_offset, match_text, value'
+        return {
+            'table': f"""CREATE TABLE {exists}{t} (source_file TEXT NOT NULL, pattern TEXT NOT NULL, line_no BIGINT NOT NULL,
+                        column_name TEXT NOT NULL, start_offset INTEGER, end_offset INTEGER, match_text TEXT, value TEXT,
+                        UNIQUE (source_file, pattern, line_no, column_name))""",
+            'indexes': [f"CREATE INDEX IF NOT EXISTS {t}_pattern_idx ON {t} (pattern, source_file)",
+                        f"CREATE INDEX IF NOT EXISTS {t}_line_idx ON {t} (line_no)"],
+            'files': f"""CREATE TABLE IF NOT EXISTS {t}_files (source_file TEXT NOT NULL, query TEXT NOT NULL,
+                        size BIGINT, mtime BIGINT, PRIMARY KEY (source_file, query))""",
+            'delete': f"DELETE FROM {t} WHERE source_file = {p} AND pattern = {p}",
+            'insert': f"""INSERT INTO {t} ({cols}) VALUES {'%s' if p == '%s' else '(' + ','.join([p] * 8) + ')'}
+                        ON CONFLICT (source_file, pattern, line_no, column_name) DO UPDATE SET
+                        start_offset = excluded.start_offset, end_offset = excluded.end_offset,
+                        match_text = excluded.match_text, value = excluded.value""",
+            'mark': f"""INSERT INTO {t}_files (source_file, query, size, mtime) VALUES ({p},{p},{p},{p})
+                        ON CONFLICT (source_file, query) DO UPDATE SET size = excluded.size, mtime = excluded.mtime""",
+            'fingerprints': f"SELECT source_file, size, mtime FROM {t}_files WHERE query = {p}",
+        }
+
+    def _pool(self) -> pg_pool:
+        """Get the postgres connection pool of the sink, creating it on first use.
+
+        Returns:
+            `pg_pool`: Connection pool.
+        """
+
+        if self.pool is None:
+            self.pool = pg_pool(ini = self.ini)
+        return self.pool
+
+    def _write(self, cur, rows: Iterable[match_record], sources: list[str] | None, param: str, many, bulk,
+               setup: bool = True, kept: list[str] | None = None) -> None:
+        """Run the statements of an ingestion on an open cursor. The caller owns the transaction.
+
+        Args:
+            * `cur` (cursor): Database cursor.
+            * `rows` (Iterable[match_record]): Match records.
+            * `sources` (list[str] | None): Queried files. Their old rows are replaced and their fingerprints recorded.
+            * `param` (str): Parameter placeholder of the engine.
+            * `many` (Callable): Function running a statement over a list of parameter tuples.
+            * `bulk` (Callable): Function running the insert statement over a batch of rows.
+            * `setup` (bool, optional): Create the tables and indexes. Defaults to True.
+            * `kept` (list[str] | None, optional): Sources whose old rows are kept and only upserted, e.g. files
+                                                   scanned from a checkpoint. Defaults to None.
+        """
+
+        sql = self._statements(param = param)
+        if setup:
+            cur.execute(sql['table'])
+            for index in sql['indexes']:
+                cur.execute(index)
+            cur.execute(sql['files'])
+        sources = sources or []
+        kept = set(kept or [])
+        stale = [fl for fl in sources if fl not in kept]
+        if stale:
+            many(cur, sql['delete'], [(fl, pat) for fl in stale for pat in self.patterns])
+        for batch in _batches(rows = rows, size = self.batch_size):
+            bulk(cur, sql['insert'], batch)
+        if sources:
+            many(cur, sql['mark'], [(fl, self.query) + _fingerprint(fl = fl) for fl in sources])
+
+    def _to_sqlite(self, rows: Iterable[match_record], db_name: str, sources: list[str] | None = None,
+                   kept: list[str] | None = None) -> str:
+        """Write rows to a sqlite3 database.
 
         Args:
-            * `jsonf` (str): .json file name/path.
+            * `rows` (Iterable[match_record]): Match records.
             * `db_name` (str): Name of .db file.
+            * `sources` (list[str] | None, optional): Queried files. Defaults to None.
+            * `kept` (list[str] | None, optional): Sources whose old rows are kept, see _write. Defaults to None.
 
         Returns:
             `str`: Database name.
         """
 
         import sqlite3
-        cols, rows = _df_parser(jsonf = jsonf)
-
         con = sqlite3.connect(db_name)
         cur = con.cursor()
-        table_name = f'{Path(jsonf).stem}_table'
-        cur.execute(f'''CREATE TABLE {table_name} (json_keys, json_values)''')
-
-        # Iterate through cols and rows and add each column values into json_keys column and each rows value into json_values column.
-        for key, val in zip(cols, rows):
-            cur.execute(f"INSERT INTO {table_name} (json_keys, json_values) VALUES (?,?)", (key,val))
-        con.commit()
+        # Bulk load settings: no rollback journal on disk and no fsync per statement.
+        cur.execute('PRAGMA journal_mode = MEMORY')
+        cur.execute('PRAGMA synchronous = OFF')
+        cur.execute('PRAGMA temp_store = MEMORY')
+
+        with con:   # Single transaction.
+            executemany = lambda c, q, b: c.executemany(q, b)
+            self._write(cur, rows = rows, sources = sources, param = '?', many = executemany, bulk = executemany,
+                        kept = kept)
+        con.close()
         return db_name
 
-    def _json_to_postgres(self, jsonf: str) -> str:
-        """Convert .json file contents to a postgres4 database.
+    def _to_postgres(self, rows: Iterable[match_record], sources: list[str] | None = None,
+                     kept: list[str] | None = None) -> str:
+        """Write rows to a postgres4 database, through a connection of the pool of the sink.
+        The database and the tables are only created on the first write through the pool.
 
         Args:
-            * `jsonf` (str): .json file name/path.
+            * `rows` (Iterable[match_record]): Match records.
+            * `sources` (list[str] | None, optional): Queried files. Defaults to None.
+            * `kept` (list[str] | None, optional): Sources whose old rows are kept, see _write. Defaults to None.
 
         Returns:
             `str`: Database name.
         """
 
-        def db_items(dictionary: dict, index: int) -> str:  # Get a dictionary item through its index and store it as a string.
-            return list(dictionary.items())[index][1]
-
-        import psycopg2
-
-        # Parse .ini to get db info
-        db_info = ini_handler(ini = self.ini)._ini_to_dict()
-        pgdatabase = db_items(dictionary = db_info, index = 0)
-        pguser = db_items(dictionary = db_info, index = 1)
-        pgpassword = db_items(dictionary = db_info, index = 2)
-        pghost = db_items(dictionary = db_info, index = 3)
-        pgport = db_items(dictionary = db_info, index = 4)
-
-        conn = psycopg2.connect(user = pguser, password = pgpassword)
-        conn.autocommit = True
-        cur = conn.cursor()
+        from psycopg2.extras import execute_batch, execute_values
+
+        pool = self._pool()
+        pool._ensure_db(reuse = self.append)
+        conn = pool._get()
+        try:
+            # Every batch is sent as one multi-row INSERT, all batches are committed as a single transaction.
+            cur = conn.cursor()
+            self._write(cur, rows = rows, sources = sources, param = '%s',
+                        many = lambda c, q, b: execute_batch(c, q, b, page_size = self.batch_size),
+                        bulk = lambda c, q, b: execute_values(c, q, b, page_size = self.batch_size),
+                        setup = self.table_name not in pool.tables, kept = kept)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            pool._put(conn)
+        pool.tables.add(self.table_name)
+        return pool.database
+
+    def _changed(self, fls: list[str], out = None) -> list[str]:
+        """Get the files whose fingerprint changed since they were last ingested with the same patterns.
+        Outside append mode, all files are returned.
 
-        # Create database and exit.
-        cur.execute(f'''CREATE database {pgdatabase}''')
-        conn.commit()
-        conn.close()
+        Args:
+            * `fls` (list[str]): Input files.
+            * `out` (str, optional): Output directory of the sqlite3 .db file. Defaults to None.
 
-        # Reconnect to created db and run commands.
-        conn = psycopg2.connect(database = pgdatabase, user = pguser, password = pgpassword, host = pghost, port = pgport)
-        conn.autocommit = True
-        cur = conn.cursor()
-        table_name = f'{Path(jsonf).stem}_table'
-        cur.execute(f"""CREATE TABLE {table_name} (json_keys VARCHAR(255) UNIQUE NOT NULL, json_values VARCHAR(255) UNIQUE NOT NULL)""")
-        cols, rows = _df_parser(jsonf = jsonf)
+        Returns:
+            `list[str]`: Files that have to be queried.
+        """
 
-        # Iterate through cols and rows and add each column values into json_keys column and each rows value into json_values column.
-        for key, val in zip(cols, rows):
-            cur.execute(f"INSERT INTO {table_name} (json_keys, json_values) VALUES (%s,%s)", (key,val))
-        conn.commit()
-        conn.close()
+        if not self.append:
+            return list(fls)
 
-        return pgdatabase
+        self._supp_db(dbtp = self.db_type)
+        known = {}
+        if self.db_type == 'sqlite':
+            import sqlite3
+            db_name = os.path.join(out, self.db_name) if out else self.db_name
+            if os.path.isfile(db_name):
+                con = sqlite3.connect(db_name)
+                try:
+                    rows = con.execute(self._statements(param = '?')['fingerprints'], (self.query,)).fetchall()
+                    known = {fl: (size, mtime) for fl, size, mtime in rows}
+                except sqlite3.OperationalError:    # No fingerprints table yet.
+                    pass
+                finally:
+                    con.close()
+        else:
+            pool = self._pool()
+            if not pool._db_exists():
+                return list(fls)
+            conn = pool._get()
+            try:
+                cur = conn.cursor()
+                cur.execute('SELECT to_regclass(%s)', (f'{self.table_name}_files',))
+                if cur.fetchone()[0] is not None:
+                    cur.execute(self._statements(param = '%s')['fingerprints'], (self.query,))
+                    known = {fl: (size, mtime) for fl, size, mtime in cur.fetchall()}
+                conn.rollback()     # End the read transaction before returning the connection.
+            finally:
+                pool._put(conn)
+
+        return [fl for fl in fls if known.get(fl) != _fingerprint(fl = fl)]
 
     @classmethod
     def _supp_db(cls, dbtp: str) -> None:
@@ -170,21 +458,41 @@ class json_db(dunders):
         if not dbtp in cls.db_supp_types:
             raise DBTypeError(f'Database engine {dbtp} is not supported. Supported database engines are: {", ".join(cls.db_supp_types)}')
 
-    def invoker(self, out) -> str:
-        """Invoker method for running the requested database generator.
+    def ingest(self, rows: Iterable[match_record], out = None, sources: list[str] | None = None,
+               kept: list[str] | None = None) -> str:
+        """Write rows streamed from a query into the requested database.
+
+        Args:
+            * `rows` (Iterable[match_record]): Match records, e.g. from search_tools._iter_records.
+            * `out` (str, optional): Output directory of the sqlite3 .db file. Defaults to None.
+            * `sources` (list[str] | None, optional): Queried files. Their previous rows for the same patterns are
+                                                     replaced and their fingerprints recorded. Defaults to None.
+            * `kept` (list[str] | None, optional): Sources only scanned from a checkpoint on. Their previous rows
+                                                  are kept and the new matches upserted. Defaults to None.
+
+        Returns:
+            `str`: Database name.
         """
 
-        func_dict = {'sqlite': self._json_to_sqlite,
-                    'postgres': self._json_to_postgres}
+        func_dict = {'sqlite': self._to_sqlite,
+                    'postgres': self._to_postgres}
 
         self._supp_db(dbtp = self.db_type)
         if self.db_type in func_dict:
             if out:
                 self.db_name = os.path.join(out, self.db_name)
-            if self.db_type == 'sqlite':
-                invoked = func_dict[self.db_type](self.jsonf, db_name = self.db_name)
-            else:
-                invoked = func_dict[self.db_type](jsonf = self.jsonf)
+            with _stage(f'insert.{self.db_type}') as st:
+                rows = _tally(items = rows, counters = st)
+                if self.db_type == 'sqlite':
+                    invoked = func_dict[self.db_type](rows, db_name = self.db_name, sources = sources, kept = kept)
+                else:
+                    invoked = func_dict[self.db_type](rows, sources = sources, kept = kept)
             return invoked
         else:
-            raise KeyError(f'{self.db_type} key is not present in the functions dictionary in the invoker method.')
+            raise KeyError(f'{self.db_type} key is not present in the functions dictionary in the ingest method.')
+
+    def invoker(self, out) -> str:
+        """Invoker method for writing the contents of the .json file into the requested database.
+        """
+
+        return self.ingest(rows = _json_rows(jsonf = self.jsonf), out = out)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import json
+from typing import IO, Iterable, Iterator
+from lib.records import match_record
+from lib.utils import dunders
+
+class jsonl_writer(dunders):
+    """Streaming JSON Lines (NDJSON) output. Every match record is written as one JSON object per line as soon
+    as it is found, so memory use stays constant whatever the number of matches. The output is flushed after the
+    first record and then every flush_every records, so downstream consumers get the first results right away.
+
+    Args:
+        * `fl` (str): Output file name/path, the extension of the compression is added if missing.
+        * `compression` (str | None, optional): Compression of the output, 'gzip' or 'zstd'.
+                                                zstd needs the zstandard package. Defaults to None.
+        * `flush_every` (int, optional): Number of records between flushes. Defaults to 1000.
+    """
+
+    comp_ext = {'gzip': '.gz', 'zstd': '.zst'}
+
+    def __init__(self, fl: str, compression: str | None = None, flush_every: int = 1000) -> None:
+        if compression is not None and compression not in self.comp_ext:
+            raise ValueError(f'Compression {compression} is not supported. Supported compressions are: {", ".join(self.comp_ext)}')
+        ext = self.comp_ext.get(compression, '')
+        self.fl = fl if fl.endswith(ext) else f'{fl}{ext}'
+        self.compression = compression
+        self.flush_every = flush_every
+        self.count = 0
+        super().__init__()
+
+    def _open(self) -> IO[str]:
+        """Open the output file for writing text, through the requested compressor.
+
+        Returns:
+            `IO[str]`: Text stream.
+        """
+
+        if self.compression == 'gzip':
+            import gzip
+            return gzip.open(self.fl, 'wt', encoding = 'utf-8', compresslevel = 6)
+        if self.compression == 'zstd':
+            import io, zstandard
+            return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(self.fl, 'wb')), encoding = 'utf-8')
+        return open(self.fl, 'w', encoding = 'utf-8')
+
+    def _tee(self, records: Iterable[match_record]) -> Iterator[match_record]:
+        """Write match records while passing them on, e.g. to a database sink.
+
+        Args:
+            * `records` (Iterable[match_record]): Match records.
+
+        Yields:
+            `match_record`: The written match records.
+        """
+
+        dumps = json.dumps
+        fields = match_record._fields
+        with self._open() as f:
+            for r in records:
+                f.write(dumps(dict(zip(fields, r)), ensure_ascii = False))
+                f.write('\n')
+                self.count += 1
+                if self.count == 1 or not self.count % self.flush_every:
+                    f.flush()
+                yield r
+
+    def write(self, records: Iterable[match_record]) -> str:
+        """Write match records.
+
+        Args:
+            * `records` (Iterable[match_record]): Match records.
+
+        Returns:
+            `str`: Output file name/path.
+        """
+
+        for _ in self._tee(records = records):
+            pass
+        return self.fl
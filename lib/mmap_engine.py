@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import re, os, mmap
+from bisect import bisect_right
+from typing import Iterator
+from lib.patterns import _prefilter, _bytes_safe
+from lib.utils import dunders
+
+class line_index(dunders):
+    """Lazily built newline-offset index over a byte buffer.
+
+    Only the offsets that are actually looked up are recorded, together with the number of newlines
+    preceding them. A lookup counts the newlines between the closest recorded offset and the requested one,
+    so the buffer is never decoded or split into lines.
+
+    Args:
+        * `buf` (mmap.mmap | bytes): Buffer to index.
+        * `start` (int, optional): Byte offset of line 0. Defaults to 0.
+    """
+
+    block = 8 * 1024 ** 2   # mmap objects have no count method, newlines are counted in blocks of this size.
+
+    def __init__(self, buf, start: int = 0) -> None:
+        self.buf = buf
+        self.offsets = [start]
+        self.lines = [0]
+        super().__init__()
+
+    def _count(self, start: int, end: int) -> int:
+        """Count the newlines between two byte offsets.
+
+        Args:
+            * `start` (int): Start offset.
+            * `end` (int): End offset.
+
+        Returns:
+            `int`: Number of newlines.
+        """
+
+        n = 0
+        for i in range(start, end, self.block):
+            n += self.buf[i:min(i + self.block, end)].count(b'\n')
+        return n
+
+    def line_of(self, pos: int) -> int:
+        """Get the line index of a byte offset.
+
+        Args:
+            * `pos` (int): Byte offset in the buffer.
+
+        Returns:
+            `int`: Zero based line index.
+        """
+
+        i = bisect_right(self.offsets, pos) - 1
+        line = self.lines[i] + self._count(self.offsets[i], pos)
+        if pos > self.offsets[-1]:
+            self.offsets.append(pos)
+            self.lines.append(line)
+        return line
+
+def _scan_range(fl: str, pat: str, start: int, end: int) -> tuple[list[tuple[int, str]], int]:
+    """Scan a newline aligned byte range of a file. Module level function, so that it can be sent to worker processes.
+
+    Args:
+        * `fl` (str): File name/path.
+        * `pat` (str): Pattern to look for.
+        * `start` (int): Start offset of the range.
+        * `end` (int): End offset of the range.
+
+    Returns:
+        `tuple[list[tuple[int, str]], int]`: Matches with line indices local to the range and the number of lines in the range.
+    """
+
+    regex, cand = mmap_engine._compile(pat = pat)
+    lit = _prefilter(pat = pat)
+    found = []
+    with open(fl, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as buf:
+            idx = line_index(buf, start = start)
+            for ln_start, line in mmap_engine._buf_scan(buf, regex, cand, start, end, lit):
+                found.append((idx.line_of(ln_start), line.strip()))
+            n_lines = idx.line_of(end)
+    return found, n_lines
+
+def _block_lines(text: str, lit: str, regex: re.Pattern | None, dense: float = 0.05) -> list[tuple[int, str]]:
+    """Find the lines of a block of text matching a pattern that holds a literal, see mmap_engine._lit_scan.
+    Looking up every hit of the literal costs a few Python calls, more than splitting the block into lines when
+    the literal is common, so dense blocks are split into lines and checked with a substring test instead.
+
+    Args:
+        * `text` (str): Block of text.
+        * `lit` (str): Literal every match holds, see _prefilter.
+        * `regex` (re.Pattern | None): Compiled pattern, None when the pattern is the literal itself.
+        * `dense` (float, optional): Fraction of lines holding the literal from which the block is split. Defaults to 0.05.
+
+    Returns:
+        `list[tuple[int, str]]`: Line index in the block and stripped line contents for every matching line.
+    """
+
+    if text.count(lit) > dense * (text.count('\n') + 1):
+        lines = enumerate(text.split('\n'))
+        if regex is None:
+            return [(i, line.strip()) for i, line in lines if lit in line]
+        search = regex.search   # As in _lit_scan, the regex runs on the line without the \r of a CRLF line ending.
+        return [(i, line.strip()) for i, line in lines if lit in line and search(line.rstrip('\r'))]
+
+    found, index, counted = [], 0, 0
+    for ln_start, line in mmap_engine._lit_scan(text, lit, regex):
+        index += text.count('\n', counted, ln_start)
+        counted = ln_start
+        found.append((index, line.strip()))
+    return found
+
+class mmap_engine(dunders):
+    """Zero-copy regex scanner for large text files. The file is memory mapped and searched as bytes for the
+    candidate lines of the pattern, with its literal or with the pattern itself where it is safe on bytes (see
+    _bytes_safe). Only the candidate lines are copied out of the buffer and decoded, and the pattern decides
+    on each of them as a string, as in the line by line parser. Patterns without either are checked line by line.
+
+    Args:
+        * `fl` (str): Input file.
+        * `pattern` (str): Input pattern.
+    """
+
+    def __init__(self, fl: str, pattern: str) -> None:
+        self.fl = fl
+        self.pattern = pattern
+        super().__init__()
+
+    @staticmethod
+    def _compile(pat: str) -> tuple[re.Pattern, re.Pattern | None]:
+        """Compile a pattern for the lines of a buffer, and for finding candidate lines in the bytes of the buffer.
+        Multiline mode is set on the bytes pattern, so that ^ anchors to every line as in the line by line parser.
+
+        Args:
+            * `pat` (str): Pattern to compile.
+
+        Returns:
+            `tuple[re.Pattern, re.Pattern | None]`: Compiled pattern and compiled bytes pattern, None if the pattern
+                                                   may miss lines when run as bytes.
+        """
+
+        return re.compile(pat), re.compile(pat.encode('utf-8'), re.MULTILINE) if _bytes_safe(pat = pat) else None
+
+    @staticmethod
+    def _supports(pat: str) -> bool:
+        """Check if the candidate lines of a pattern can be found in the bytes of the buffer, by its literal or by the
+        pattern itself. Other patterns are checked on every line, which the line by line parser does faster.
+
+        Args:
+            * `pat` (str): Pattern.
+
+        Returns:
+            `bool`: True if the buffer is searched for candidate lines.
+        """
+
+        return _prefilter(pat = pat)[0] is not None or _bytes_safe(pat = pat)
+
+    @staticmethod
+    def _line(buf, ln_start: int, ln_end: int) -> str:
+        """Get a line of a buffer as a string, without the \\r of a CRLF line ending, as read by the line by line parser.
+
+        Args:
+            * `buf` (mmap.mmap | bytes | str): Buffer.
+            * `ln_start` (int): Start offset of the line.
+            * `ln_end` (int): End offset of the line, at its newline.
+
+        Returns:
+            `str`: Line contents.
+        """
+
+        line = buf[ln_start:ln_end]
+        if not isinstance(line, str):
+            line = line.decode('utf-8', errors = 'replace')
+        return line.rstrip('\r')
+
+    @staticmethod
+    def _lit_scan(buf, lit: str, regex: re.Pattern | None, start: int = 0,
+                  end: int | None = None) -> Iterator[tuple[int, str]]:
+        """Scan a buffer for lines holding a literal with substring search, and only run the regex on those lines.
+        The regex runs on the line alone, as a string, as in the line by line parser.
+
+        Args:
+            * `buf` (mmap.mmap | bytes | str): Buffer to scan.
+            * `lit` (str): Literal every match holds, see _prefilter.
+            * `regex` (re.Pattern | None): Compiled string pattern. None when the pattern is the literal itself,
+                                           then every line holding it is a match.
+            * `start` (int, optional): Offset to start from. Defaults to 0.
+            * `end` (int | None, optional): Offset to stop at. Defaults to None, the end of the buffer.
+
+        Yields:
+            `tuple[int, str]`: Start offset and contents of every matching line.
+        """
+
+        if end is None:
+            end = len(buf)
+        nl = '\n' if isinstance(buf, str) else b'\n'
+        if not isinstance(buf, str):
+            lit = lit.encode('utf-8')
+        pos = start
+        while (i := buf.find(lit, pos, end)) != -1:
+            ln_start = buf.rfind(nl, start, i) + 1 or start
+            ln_end = buf.find(nl, i, end)
+            if ln_end == -1:
+                ln_end = end
+            line = mmap_engine._line(buf, ln_start, ln_end)
+            if regex is None or regex.search(line):
+                yield ln_start, line
+            pos = ln_end + 1
+
+    @staticmethod
+    def _buf_scan(buf, regex: re.Pattern, cand: re.Pattern | None, start: int = 0, end: int | None = None,
+                  lit: tuple[str | None, bool] = (None, False)) -> Iterator[tuple[int, str]]:
+        """Scan a buffer for lines matching a pattern. Every matching line is reported once. The buffer is searched
+        for candidate lines, with the literal of the pattern if it holds one (see _lit_scan), or else with the
+        bytes pattern. A line is a match only when the pattern matches the decoded line alone, so results are the
+        same as those of the line by line parser. Without either, every line is checked.
+
+        Args:
+            * `buf` (mmap.mmap | bytes): Buffer to scan.
+            * `regex` (re.Pattern): Compiled string pattern, see _compile.
+            * `cand` (re.Pattern | None): Compiled bytes pattern, see _compile.
+            * `start` (int, optional): Byte offset to start from. Defaults to 0.
+            * `end` (int | None, optional): Byte offset to stop at. Defaults to None, the end of the buffer.
+            * `lit` (tuple[str | None, bool], optional): Literal of the pattern and whether the pattern is
+                                                         that literal, see _prefilter. Defaults to no literal.
+
+        Yields:
+            `tuple[int, str]`: Start offset and contents of every matching line.
+        """
+
+        if lit[0] is not None:
+            yield from mmap_engine._lit_scan(buf, lit[0], None if lit[1] else regex, start, end)
+            return
+
+        if end is None:
+            end = len(buf)
+        pos = start
+        while pos < end:
+            if cand is None:
+                ln_start = pos
+            else:
+                m = cand.search(buf, pos, end)
+                if m is None or (m.start() == end and buf[end - 1:end] == b'\n'):   # No line after a trailing newline.
+                    break
+                ln_start = buf.rfind(b'\n', start, m.start()) + 1 or start
+            ln_end = buf.find(b'\n', ln_start, end)
+            if ln_end == -1:
+                ln_end = end
+            # The bytes match may span lines, e.g. through [\n ]+, or end at the range end. The line alone decides,
+            # as in the line by line parser.
+            line = mmap_engine._line(buf, ln_start, ln_end)
+            if regex.search(line):
+                yield ln_start, line
+            pos = ln_end + 1
+
+    def _scan(self) -> Iterator[tuple[int, str]]:
+        """Scan the memory mapped file.
+
+        Yields:
+            `tuple[int, str]`: Line index and stripped line contents for every line matching the pattern.
+        """
+
+        regex, cand = self._compile(pat = self.pattern)
+        lit = _prefilter(pat = self.pattern)
+        with open(self.fl, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:   # Empty files cannot be mapped.
+                return
+            with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as buf:
+                idx = line_index(buf)
+                for ln_start, line in self._buf_scan(buf, regex, cand, lit = lit):
+                    yield idx.line_of(ln_start), line.strip()
+
+    def _split_ranges(self, n: int) -> list[tuple[int, int]]:
+        """Split the file into byte ranges of about equal size. Every range ends right after a newline,
+        so no line is split between two ranges.
+
+        Args:
+            * `n` (int): Number of ranges.
+
+        Returns:
+            `list[tuple[int, int]]`: Start and end offsets of every range.
+        """
+
+        with open(self.fl, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return []
+            with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as buf:
+                bounds = [0]
+                for i in range(1, n):
+                    nl = buf.find(b'\n', max(size * i // n, bounds[-1]))
+                    if nl == -1:
+                        break
+                    if nl + 1 > bounds[-1]:
+                        bounds.append(nl + 1)
+                if bounds[-1] < size:
+                    bounds.append(size)
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def _parallel_scan(self, workers: int) -> Iterator[tuple[int, str]]:
+        """Scan the file in parallel. The file is split into newline aligned byte ranges, which are scanned
+        in worker processes. Global line indices are rebuilt from the number of lines of the preceding ranges.
+
+        Args:
+            * `workers` (int): Number of worker processes.
+
+        Yields:
+            `tuple[int, str]`: Line index and stripped line contents for every line matching the pattern.
+        """
+
+        ranges = self._split_ranges(n = workers)
+        if not ranges:
+            return
+        n = len(ranges)
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers = min(workers, n)) as pool:
+            results = pool.map(_scan_range, [self.fl] * n, [self.pattern] * n, *zip(*ranges))
+            offset = 0
+            for found, n_lines in results:
+                for line, text in found:
+                    yield offset + line, text
+                offset += n_lines
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import re, csv
+from lib.exceptions import InputflError
+from lib.utils import dunders
+
+_META = frozenset('.^$*+?{}[]\\|()')
+
+def _is_literal(pat: str) -> bool:
+    """Check if a pattern holds no regex metacharacters, so that it only matches itself.
+
+    Args:
+        * `pat` (str): Pattern.
+
+    Returns:
+        `bool`: True if the pattern is a plain string.
+    """
+
+    return not _META.intersection(pat)
+
+def _literal(pat: str) -> str | None:
+    """Get the string a pattern stands for, if it only matches that string, e.g. "a.b" for a\\.b.
+    Escaped metacharacters are resolved, so patterns escaped with re.escape are literals too.
+
+    Args:
+        * `pat` (str): Pattern.
+
+    Returns:
+        `str | None`: The literal string, None if the pattern is a regex.
+    """
+
+    if _is_literal(pat):
+        return pat
+
+    try:
+        from re import _parser as sre_parse
+    except ImportError:     # Python < 3.11.
+        import sre_parse
+
+    try:
+        parsed = sre_parse.parse(pat)
+    except re.error:
+        return None
+    if parsed.state.flags & re.IGNORECASE or any(op is not sre_parse.LITERAL for op, _ in parsed):
+        return None
+    return ''.join(chr(av) for _, av in parsed)
+
+def _prefilter(pat: str, min_len: int = 3) -> tuple[str | None, bool]:
+    """Pick a literal to look for ahead of the regex engine. Substring search is much cheaper than the regex
+    engine, so scan engines can find the candidate lines holding the literal first, and only run the regex on them.
+    Literals spanning lines are never picked, as matches are reported per line.
+
+    Args:
+        * `pat` (str): Pattern.
+        * `min_len` (int, optional): Minimum length of a required literal of a regex, shorter literals
+                                     are too common to narrow the scan. Defaults to 3.
+
+    Returns:
+        `tuple[str | None, bool]`: The literal, None if there is none, and whether the pattern is that literal,
+                                   in which case a line holding it is a match and the regex can be skipped.
+    """
+
+    lit = _literal(pat = pat)
+    if lit is not None:
+        return (lit, True) if lit and '\n' not in lit else (None, False)
+    lits = [l for l in _required_literals(pat = pat) if len(l) >= min_len and '\n' not in l]
+    return (max(lits, key = len), False) if lits else (None, False)
+
+def _required_literals(pat: str) -> list[str]:
+    """Extract the literal substrings that every match of a regex must contain. Only literals that are
+    required on all paths through the regex are returned, e.g. "foo" and "bar" for foo\\d+(bar)+x?.
+    Case insensitive patterns and alternations yield no literals.
+
+    Args:
+        * `pat` (str): Pattern.
+
+    Returns:
+        `list[str]`: Required literal substrings, empty if none could be extracted.
+    """
+
+    try:
+        from re import _parser as sre_parse
+    except ImportError:     # Python < 3.11.
+        import sre_parse
+
+    try:
+        parsed = sre_parse.parse(pat)
+    except re.error:
+        return []
+    if parsed.state.flags & re.IGNORECASE:
+        return []
+
+    repeats = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None))
+    lits = []
+
+    def walk(seq) -> None:
+        run = []
+        for op, av in seq:
+            if op is sre_parse.LITERAL:
+                run.append(chr(av))
+                continue
+            if run:
+                lits.append(''.join(run))
+                run = []
+            if op is sre_parse.SUBPATTERN and not av[1] & re.IGNORECASE:
+                walk(av[-1])
+            elif op in repeats and av[0] >= 1:
+                walk(av[2])
+            elif op is getattr(sre_parse, 'ATOMIC_GROUP', None):
+                walk(av)
+        if run:
+            lits.append(''.join(run))
+
+    walk(parsed)
+    return lits
+
+_FLAGS = re.compile(r'\(\?([aiLmsux]+)\)')
+
+def _scoped(pat: str) -> str:
+    """Turn the global flags at the start of a pattern into flags scoped to the pattern, e.g. (?i:abc) for (?i)abc,
+    so that the pattern can be embedded in a larger regex without its flags applying to the rest of it.
+
+    Args:
+        * `pat` (str): Pattern.
+
+    Returns:
+        `str`: Pattern with scoped flags, the pattern itself if it has no global flags.
+    """
+
+    flags, pos = '', 0
+    while m := _FLAGS.match(pat, pos):
+        flags += m.group(1)
+        pos = m.end()
+    if not flags:
+        return pat
+    return f'(?{"".join(dict.fromkeys(flags))}:{pat[pos:]})'
+
+def _group_refs(pat: str) -> bool:
+    """Check if a pattern refers to its own groups, e.g. (a)\\1, (?P<q>.)(?P=q) or (a)?(?(1)b|c).
+    Group numbers shift when patterns are combined into a single regex, so such patterns cannot be combined.
+
+    Args:
+        * `pat` (str): Pattern.
+
+    Returns:
+        `bool`: True if the pattern holds group references.
+    """
+
+    try:
+        from re import _parser as sre_parse
+    except ImportError:     # Python < 3.11.
+        import sre_parse
+
+    refs = (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS)
+
+    def walk(node) -> bool:
+        if isinstance(node, sre_parse.SubPattern):
+            return any(op in refs or walk(av) for op, av in node)
+        if isinstance(node, (list, tuple)):
+            return any(walk(n) for n in node)
+        return False
+
+    return walk(sre_parse.parse(pat))
+
+def _bytes_safe(pat: str) -> bool:
+    """Check if a pattern, run as bytes over UTF-8 text, matches every line it matches as a string. Only ASCII
+    literals, character sets and ranges, groups, repeats, lookarounds and start anchors are allowed. Constructs
+    that consume or look at non-ASCII characters differently in bytes, i.e. ., \\w, \\d, \\s, \\b, negated sets
+    and case insensitive matching, are not, nor is $, which does not match before the \\r of a CRLF line.
+
+    Args:
+        * `pat` (str): Pattern.
+
+    Returns:
+        `bool`: True if the bytes pattern finds a superset of the lines matched by the string pattern.
+    """
+
+    try:
+        from re import _parser as sre_parse
+    except ImportError:     # Python < 3.11.
+        import sre_parse
+
+    try:
+        parsed = sre_parse.parse(pat)
+    except re.error:
+        return False
+    if parsed.state.flags & re.IGNORECASE:
+        return False
+
+    repeats = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None))
+    anchors = (sre_parse.AT_BEGINNING, sre_parse.AT_BEGINNING_STRING)
+
+    def ascii_set(items) -> bool:
+        return all((op is sre_parse.LITERAL and av < 128) or (op is sre_parse.RANGE and av[1] < 128)
+                   for op, av in items)
+
+    def walk(seq) -> bool:
+        for op, av in seq:
+            if op is sre_parse.LITERAL:
+                ok = av < 128
+            elif op is sre_parse.IN:
+                ok = ascii_set(items = av)
+            elif op is sre_parse.AT:
+                ok = av in anchors
+            elif op is sre_parse.SUBPATTERN:
+                ok = not av[1] & re.IGNORECASE and walk(av[-1])
+            elif op is sre_parse.BRANCH:
+                ok = all(walk(s) for s in av[1])
+            elif op in repeats:
+                ok = walk(av[2])
+            elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+                ok = walk(av[1])
+            elif op is getattr(sre_parse, 'ATOMIC_GROUP', None):
+                ok = walk(av)
+            elif op is sre_parse.GROUPREF_EXISTS:
+                ok = walk(av[1]) and (av[2] is None or walk(av[2]))
+            else:
+                ok = op is sre_parse.GROUPREF
+            if not ok:
+                return False
+        return True
+
+    return walk(parsed)
+
+def _read_patterns(fl: str) -> list[str]:
+    """Read patterns from a pattern file. Every non-empty line of a text file is a pattern.
+    For a .csv or .tsv pattern file, every non-empty cell is a pattern.
+
+    Args:
+        * `fl` (str): Pattern file name/path.
+
+    Raises:
+        `InputflError`: The pattern file holds no patterns.
+
+    Returns:
+        `list[str]`: Patterns, in file order and without duplicates.
+    """
+
+    with open(fl, "r", encoding = 'utf-8-sig') as f:
+        if fl.endswith(('.csv', '.tsv')):
+            rows = csv.reader(f, delimiter = '\t' if fl.endswith('.tsv') else ',')
+            pats = [cell for row in rows for cell in row]
+        else:
+            pats = [line.rstrip('\n') for line in f]
+
+    pats = list(dict.fromkeys(p for p in pats if p))
+    if not pats:
+        raise InputflError(f'Pattern file: {fl} holds no patterns.')
+    return pats
+
+def _trie_regex(lits: list[str]) -> str:
+    """Build a regex from a set of literal strings, factored by common prefixes into a trie.
+    The regex engine then walks each shared prefix once, instead of retrying every literal at every position.
+
+    Args:
+        * `lits` (list[str]): Literal strings.
+
+    Returns:
+        `str`: Regex matching any of the literals.
+    """
+
+    trie = {}
+    for lit in lits:
+        node = trie
+        for ch in lit:
+            node = node.setdefault(ch, {})
+        node[''] = {}   # End of a literal.
+
+    def to_regex(node: dict) -> str:
+        end = '' in node
+        alts = [re.escape(ch) + to_regex(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ''
+        body = alts[0] if len(alts) == 1 else '(?:' + '|'.join(alts) + ')'
+        if end:
+            body = '(?:' + body + ')?'
+        return body
+
+    return to_regex(trie)
+
+class pattern_set(dunders):
+    """Set of patterns matched in a single pass. The patterns are combined into one regex, which is what the
+    scan engines run over the file. Only the lines/cells that match the combined regex are then tagged with the
+    patterns they match, so the cost of a scan scales with the file size and not with the number of patterns.
+
+    Sets made only of plain (or escaped) strings are combined into a prefix trie, other sets into an alternation
+    of groups, with the global flags of every pattern scoped to its group. Patterns referring to their own groups
+    cannot be combined, as group numbers shift in the alternation.
+
+    Args:
+        * `patterns` (list[str]): Patterns.
+
+    Raises:
+        `InputflError`: The patterns cannot be combined into a single regex.
+    """
+
+    def __init__(self, patterns: list[str]) -> None:
+        self.patterns = list(dict.fromkeys(patterns))
+        self.compiled = [re.compile(p) for p in self.patterns]
+        lits = [_literal(pat = p) for p in self.patterns]
+        if all(lit is not None for lit in lits):
+            self.combined = _trie_regex(lits = lits)
+        else:
+            if len(self.patterns) > 1:
+                for p in self.patterns:
+                    if _group_refs(pat = p):
+                        raise InputflError(f'Pattern: {p} refers to its own groups and cannot be matched together '
+                                           'with other patterns, query it on its own with -p.')
+            self.combined = '|'.join(f'(?:{_scoped(pat = p)})' for p in self.patterns)
+            try:
+                re.compile(self.combined)
+            except re.error as e:   # E.g. the same group name in two patterns.
+                raise InputflError(f'Patterns cannot be matched together: {e}.') from None
+        super().__init__()
+
+    def _tags(self, text: str, full: bool = False) -> list[tuple[str, re.Match]]:
+        """Get the patterns that match a string.
+
+        Args:
+            * `text` (str): Matched line or cell.
+            * `full` (bool, optional): Whole string has to match the pattern, as for spreadsheet cells. Defaults to False.
+
+        Returns:
+            `list[tuple[str, re.Match]]`: Matching patterns and their first match in the string.
+        """
+
+        tags = []
+        for p, r in zip(self.patterns, self.compiled):
+            m = r.fullmatch(text) if full else r.search(text)
+            if m:
+                tags.append((p, m))
+        return tags
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import json, sys, time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator
+from lib.utils import dunders
+
+_active: stage_profiler | None = None     # Profiler of the current run, None when profiling is off.
+
+def _rss_mb() -> float | None:
+    """Peak resident set size of the process so far.
+
+    Returns:
+        `float | None`: Peak RSS in MB, None where the resource module is not available.
+    """
+
+    try:
+        import resource
+    except ImportError:     # Windows.
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 ** (2 if sys.platform == 'darwin' else 1)
+
+class stage_profiler(dunders):
+    """Opt-in per stage instrumentation of a run. Used as a context manager, it becomes the active profiler and
+    the instrumented stages of search_tools, query_tool and json_db record into it:
+        * `search.text`, `search.fasta`, `search.spreadsheet`: Reading and matching the input file.
+        * `read_csv`, `match.spreadsheet`: Reading and matching the blocks of a spreadsheet file.
+        * `cache`: Result cache lookups.
+        * `insert.sqlite`, `insert.postgres`: Database writes.
+        * `json.dump`, `json.read`: .json output and input.
+
+    Every stage records its number of calls, wall time (inclusive, and self time without nested stages), bytes
+    processed, items produced (matches or rows) and the growth of the peak RSS. Streaming stages only count the
+    time spent producing items, not the time their consumer spends on them. Stages run in worker processes are
+    not recorded. When profiling is off, the instrumentation costs a single global lookup per stage.
+
+    Hooks are called with the stage name and the record of every finished stage call, e.g. for logging
+    or metrics in production runs:
+
+        >>> with stage_profiler(hooks = [lambda name, rec: print(name, rec['seconds'])]) as prof:
+        ...     query_tool(fl = 'log.txt', pattern = 'error').query_wrapper(show_idx = False)
+        >>> print(prof._summary())
+
+    Args:
+        * `hooks` (list[Callable[[str, dict], None]] | None, optional): Called after every stage call. Defaults to None.
+    """
+
+    def __init__(self, hooks: list[Callable[[str, dict], None]] | None = None) -> None:
+        self.hooks = list(hooks or [])
+        self.stages = {}
+        self._stack = []
+        self._prev = None
+        super().__init__()
+
+    def __enter__(self) -> stage_profiler:
+        global _active
+        self._prev, _active = _active, self
+        return self
+
+    def __exit__(self, *exc) -> None:
+        global _active
+        _active = self._prev
+
+    def _record(self, name: str, seconds: float, child: float, nbytes: int, items: int, rss: float | None) -> None:
+        """Add a finished stage call to the totals of its stage and call the hooks.
+
+        Args:
+            * `name` (str): Stage name.
+            * `seconds` (float): Wall time of the call.
+            * `child` (float): Wall time spent in nested stages.
+            * `nbytes` (int): Bytes processed.
+            * `items` (int): Items produced.
+            * `rss` (float | None): Peak RSS before the call, in MB.
+        """
+
+        after = _rss_mb()
+        growth = after - rss if after is not None and rss is not None else None
+        st = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'self_seconds': 0.0, 'bytes': 0, 'items': 0,
+                                           'rss_growth_mb': 0.0, 'peak_rss_mb': None})
+        st['calls'] += 1
+        st['seconds'] += seconds
+        st['self_seconds'] += seconds - child
+        st['bytes'] += nbytes
+        st['items'] += items
+        st['rss_growth_mb'] += growth or 0.0
+        st['peak_rss_mb'] = after
+        for hook in self.hooks:
+            hook(name, {'seconds': seconds, 'self_seconds': seconds - child, 'bytes': nbytes, 'items': items,
+                        'rss_growth_mb': growth, 'peak_rss_mb': after})
+
+    @contextmanager
+    def _stage(self, name: str, nbytes: int = 0) -> Iterator[dict]:
+        """Time a stage call.
+
+        Args:
+            * `name` (str): Stage name.
+            * `nbytes` (int, optional): Bytes processed. Defaults to 0.
+
+        Yields:
+            `dict`: Counters of the call, the caller can add to its bytes and items.
+        """
+
+        counters = {'bytes': nbytes, 'items': 0}
+        frame = [0.0]
+        rss = _rss_mb()
+        self._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield counters
+        finally:
+            seconds = time.perf_counter() - start
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1][0] += seconds
+            self._record(name, seconds, frame[0], counters['bytes'], counters['items'], rss)
+
+    def _profiled(self, name: str, items: Iterable, nbytes: int = 0) -> Iterator:
+        """Time a streaming stage, counting only the time spent producing the items.
+
+        Args:
+            * `name` (str): Stage name.
+            * `items` (Iterable): Items of the stage, e.g. matches of a search generator.
+            * `nbytes` (int, optional): Bytes processed. Defaults to 0.
+
+        Yields:
+            Items of the stage.
+        """
+
+        it = iter(items)
+        seconds, child, n = 0.0, 0.0, 0
+        rss = _rss_mb()
+        try:
+            while True:
+                frame = [0.0]
+                self._stack.append(frame)
+                start = time.perf_counter()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed = time.perf_counter() - start
+                    seconds += elapsed
+                    child += frame[0]
+                    self._stack.pop()
+                    if self._stack:     # Time spent producing items is not part of the consumer's self time.
+                        self._stack[-1][0] += elapsed
+                n += 1
+                yield item
+        finally:
+            self._record(name, seconds, child, nbytes, n, rss)
+
+    def _summary(self) -> str:
+        """Format the stage totals as a table, slowest stages first.
+
+        Returns:
+            `str`: Summary table.
+        """
+
+        rows = [f"{'stage':<20} {'calls':>6} {'total s':>10} {'self s':>10} {'MB':>10} {'MB/s':>10} {'items':>10} {'rss +MB':>9}"]
+        for name, st in sorted(self.stages.items(), key = lambda s: -s[1]['self_seconds']):
+            mb = st['bytes'] / 1024 ** 2
+            rate = f"{mb / st['seconds']:.1f}" if st['bytes'] and st['seconds'] else '-'
+            rows.append(f"{name:<20} {st['calls']:>6} {st['seconds']:>10.4f} {st['self_seconds']:>10.4f} {mb:>10.2f} "
+                        f"{rate:>10} {st['items']:>10} {st['rss_growth_mb']:>9.1f}")
+        return '\n'.join(rows)
+
+    def _dump(self, fl: str) -> str:
+        """Write the stage totals into a .json file.
+
+        Args:
+            * `fl` (str): Output file name/path.
+
+        Returns:
+            `str`: Output file name/path.
+        """
+
+        with open(fl, 'w') as f:
+            json.dump(self.stages, f, indent = 2)
+        return fl
+
+@contextmanager
+def _null_stage(nbytes: int = 0) -> Iterator[dict]:
+    """Stand-in for stage calls when profiling is off.
+
+    Args:
+        * `nbytes` (int, optional): Bytes processed. Defaults to 0.
+
+    Yields:
+        `dict`: Throwaway counters.
+    """
+
+    yield {'bytes': nbytes, 'items': 0}
+
+def _stage(name: str, nbytes: int = 0):
+    """Time a stage call in the active profiler, if any.
+
+    Args:
+        * `name` (str): Stage name.
+        * `nbytes` (int, optional): Bytes processed. Defaults to 0.
+
+    Returns:
+        Context manager yielding the counters of the call, see stage_profiler._stage.
+    """
+
+    if _active is None:
+        return _null_stage(nbytes)
+    return _active._stage(name, nbytes)
+
+def _profiled(name: str, items: Iterable, nbytes: int = 0) -> Iterable:
+    """Time a streaming stage in the active profiler, if any.
+
+    Args:
+        * `name` (str): Stage name.
+        * `items` (Iterable): Items of the stage.
+        * `nbytes` (int, optional): Bytes processed. Defaults to 0.
+
+    Returns:
+        `Iterable`: The items, unchanged when profiling is off.
+    """
+
+    if _active is None:
+        return items
+    return _active._profiled(name, items, nbytes)
+
+def _tally(items: Iterable, counters: dict) -> Iterable:
+    """Count items into the counters of a stage call, e.g. the rows of a database write.
+
+    Args:
+        * `items` (Iterable): Items.
+        * `counters` (dict): Counters of the stage call.
+
+    Returns:
+        `Iterable`: The items, unchanged when profiling is off.
+    """
+
+    if _active is None:
+        return items
+
+    def counted():
+        for item in items:
+            counters['items'] += 1
+            yield item
+    return counted()
@@ -2,6 +2,11 @@
 from __future__ import annotations
 
 from lib.search_tool import search_tools
+from lib.cache import result_cache
+from lib.compression import _base_name
+from lib.records import match_record, _assemble
+from lib.follow import tail_engine
+from lib.profiler import _stage
 from lib.utils import dunders
 
 
@@ -11,61 +16,83 @@ class query_tool(search_tools, dunders):
     Args:
         * `fl` (str): Input file.
         * `pattern` (str): Input pattern.
+        * `chunksize` (int | None, optional): Number of rows per block when reading .csv/.tsv files. Defaults to None.
+        * `workers` (int, optional): Number of worker processes for scanning large text files. Defaults to 1.
+        * `patterns` (list[str] | None, optional): Additional patterns, matched in the same pass. Defaults to None.
+        * `cache` (result_cache | None, optional): Cache of query results. A hit skips parsing the file. Defaults to None.
+        * `fasta` (bool, optional): Search FASTA files record by record. Defaults to False.
+        * `revcomp` (bool, optional): In FASTA mode, also search the reverse complement of the sequences. Defaults to False.
+        * `tail` (tail_engine | None, optional): Incremental scan of a text file, see search_tools. Defaults to None.
+        * `follow` (bool, optional): With tail, keep polling the file for appended lines. Defaults to False.
+        * `fixed` (bool, optional): Match the patterns as plain strings. Defaults to False.
     """
 
-    def __init__(self, fl: str, pattern: str) -> None:
-        super().__init__(fl, pattern)
-
-    @staticmethod
-    def _dict_parser(dictionary: dict) -> tuple[str, str]:
-        """Dictionary parser.
-
-        Args:
-            * `dictionary` (dict): Dictionary object.
-
-        Returns:
-            `tuple[str, str]`: keys and values of a dictionary as separate strings.
-        """
-
-        keys = []
-        values = []
-        for key, value in dictionary.items():
-            keys.append(key)
-            values.append(value)
-
-        keys = tuple(keys)
-        keys = ", ".join(keys)
-        values = tuple(values)
-        values = ", ".join(values)
-        return keys, values
+    def __init__(self, fl: str, pattern: str, chunksize: int | None = None, workers: int = 1,
+                patterns: list[str] | None = None, cache: result_cache | None = None, fasta: bool = False,
+                revcomp: bool = False, tail: tail_engine | None = None, follow: bool = False, fixed: bool = False) -> None:
+        super().__init__(fl, pattern, chunksize, workers, patterns, fasta, revcomp, tail, follow, fixed)
+        self.cache = cache
+        self.cache_hit = False
 
     def query_wrapper(self, show_idx) -> dict:
         """Run an SQL or txt file query. This method is a wrapper to the methods holding the queries.
+        The match records of the query are kept in the matches attribute. If a result cache is set, cached records
+        of the same query on the unchanged file are used instead, except for incremental scans.
 
         Args:
             * `show_idx` (bool): Shows regex information in stdout.
 
         Returns:
             `dict`: Keys are equal to file locations and values are matched information.
+                    For multi-pattern queries, keys are the patterns and values are such dictionaries.
         """
 
-        matches = self._get_matches()
-        keys, values = self._dict_parser(dictionary = matches)
+        if self.cache is None or self.tail is not None:
+            out = self._get_matches()
+        else:
+            options = {'patterns': self.pset.patterns if self.pset is not None else None, 'format': 'records',
+                       'fasta': self.fasta, 'revcomp': self.fasta and self.revcomp, 'fixed': self.fixed}
+            key = self.cache._key(fl = self.fl, pattern = self.pattern, options = options)
+            with _stage('cache'):
+                cached = self.cache._get(key = key)
+            if cached is not None:
+                self.cache_hit = True
+                self._set_matches(records = [match_record(*r) for r in cached])
+                out = _assemble(records = self.matches, multi_pattern = self.pset is not None)
+            else:
+                out = self._get_matches()
+                self.cache._put(key = key, value = self.matches)
 
         if show_idx:
-            print(f"There are {len(matches)} matches to the pattern: {self.pattern}")
-            if self.fl.endswith(self.txt_ext):
-                if len(keys) > 1:
-                    print(f"Pattern can be found on lines: {keys}.")
-                else:
-                    print(f"Pattern can be found on line {keys}.")
-            elif self.fl.endswith('.csv'):
-                if len(keys) > 1:
-                    print(f"Pattern can be found on columns: {keys}.")
-                else:
-                    print(f"Pattern can be found on column {keys}.")
+            self._show(out = out)
+        return out
+
+    def _show(self, out: dict) -> None:
+        """Display information about the findings in the stdout.
+
+        Args:
+            * `out` (dict): Query results.
+        """
 
-        out_dict = {}
-        for key, value in zip(list(keys.split(",")), list(values.split(","))):
-            out_dict[key] = value
-        return out_dict
+        if self.pset is not None:
+            for pat, found in out.items():
+                print(f"There are {len(found)} matches to the pattern: {pat}")
+            return
+
+        keys = ", ".join(out)
+        base = _base_name(fl = self.fl)
+        print(f"There are {len(out)} matches to the pattern: {self.labels.get(self.pattern, self.pattern)}")
+        if self.fasta:
+            print(f"Pattern can be found at: {keys}.")
+        elif base.endswith(self.txt_ext):
+            if len(out) > 1:
+                print(f"Pattern can be found on lines: {keys}.")
+            else:
+                print(f"Pattern can be found on line {keys}.")
+        elif base.endswith(self.sp_ext):
+            if len(out) > 1:
+                print(f"Pattern can be found on columns: {keys}.")
+            else:
+                print(f"Pattern can be found on column {keys}.")
+            for col, rows in self.rows.items():
+                print(f"Column {col}: rows {', '.join(str(r) for r in rows)}.")
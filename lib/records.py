@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+from typing import NamedTuple
+
+class match_record(NamedTuple):
+    """A single match of a query. Records flow unchanged from the search generators to the .json
+    and database outputs, their field order is the column order of the database table.
+
+    Fields:
+        * `source` (str): Queried file.
+        * `pattern` (str): Pattern that matched.
+        * `line` (int): Line index, or row index for spreadsheet files. -1 when unknown.
+        * `column` (str): Column name for spreadsheet files, empty for text files.
+        * `start` (int | None): Start offset of the match in the value.
+        * `end` (int | None): End offset of the match in the value.
+        * `text` (str | None): Matched text.
+        * `value` (str): Whole matched line or cell.
+    """
+
+    source: str
+    pattern: str
+    line: int
+    column: str
+    start: int | None
+    end: int | None
+    text: str | None
+    value: str
+
+    def _key(self) -> str:
+        """Location key of the record in the query results dictionary.
+
+        Returns:
+            `str`: Column name for spreadsheet files, line index otherwise.
+        """
+
+        return self.column or str(self.line)
+
+def _assemble(records: list[match_record], multi_pattern: bool = False) -> dict:
+    """Build the query results dictionary from match records.
+
+    Args:
+        * `records` (list[match_record]): Match records of a single file, in file order.
+        * `multi_pattern` (bool, optional): Key the results by pattern. Defaults to False.
+
+    Returns:
+        `dict`: Locations as keys and matched lines/cells as values. For spreadsheet files, a column keeps its last match.
+                For multi-pattern queries, keys are the patterns and values are such dictionaries.
+    """
+
+    if not multi_pattern:
+        return {r._key(): r.value for r in records}
+
+    found = {}
+    for r in records:
+        found.setdefault(r.pattern, {})[r._key()] = r.value
+    return found
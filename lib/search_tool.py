@@ -1,10 +1,19 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
-import re, csv
-import pandas as pd
+import re
 import os
+from itertools import chain
+from typing import Iterator
 from lib.exceptions import RegexError
+from lib.mmap_engine import mmap_engine, _block_lines
+from lib.index import trigram_index
+from lib.fasta import fasta_engine
+from lib.follow import tail_engine
+from lib.compression import _base_name, _compression, _open_input
+from lib.patterns import pattern_set, _prefilter
+from lib.records import match_record, _assemble
+from lib.profiler import _stage, _profiled
 from lib.utils import dunders
 
 class search_tools(dunders):
@@ -13,111 +22,353 @@ class search_tools(dunders):
     Args:
         * `fl` (str): Input file.
         * `pattern` (str): Input pattern.
+        * `chunksize` (int | None, optional): Number of rows per block when reading .csv/.tsv files.
+                                              Defaults to None, the whole file is read at once.
+        * `workers` (int, optional): Number of worker processes for scanning large text files. Defaults to 1.
+        * `patterns` (list[str] | None, optional): Additional patterns, matched together with pattern in a single pass.
+                                                   Results are then tagged by pattern. Defaults to None.
+        * `fasta` (bool, optional): Search FASTA files record by record, see fasta_engine. Defaults to False.
+        * `revcomp` (bool, optional): In FASTA mode, also search the reverse complement of the sequences. Defaults to False.
+        * `tail` (tail_engine | None, optional): Incremental scan of a text file, only the lines after its position are
+                                                 searched and the position is moved forward. Ignored, and reset to None,
+                                                 for other files. Defaults to None.
+        * `follow` (bool, optional): With tail, keep polling the file for appended lines, like tail -f. Defaults to False.
+        * `fixed` (bool, optional): Match the patterns as plain strings, like grep -F. The scan engines get the escaped
+                                    patterns, match records keep the patterns as given. Defaults to False.
+
+    Input files compressed with gzip, bz2, xz or zstd (.gz, .bz2, .xz, .zst) are decompressed on the fly,
+    their type is told from the extension underneath, e.g. reads.fasta.gz.
     """
 
     txt_ext = ('.txt', '.ini', '.fasta')
     sp_ext = ('.csv', '.tsv')
+    fa_ext = ('.fasta',)
+    mmap_threshold = 256 * 1024 ** 2    # Text files from this size (bytes) onwards are scanned through mmap.
+    parallel_threshold = 64 * 1024 ** 2 # Text files from this size (bytes) onwards are split across workers, if workers > 1.
+    frames = None                       # frame_cache of parsed spreadsheet files, set by long running processes.
+    block_size = 1024 ** 2              # Characters per block when streaming text files for a literal.
+    literal_density = 0.05              # Fraction of lines holding the literal from which files are searched line by line.
 
-    def __init__(self, fl: str, pattern: str) -> None:
+    def __init__(self, fl: str, pattern: str, chunksize: int | None = None, workers: int = 1,
+                patterns: list[str] | None = None, fasta: bool = False, revcomp: bool = False,
+                tail: tail_engine | None = None, follow: bool = False, fixed: bool = False) -> None:
         self.fl = fl
+        self.fixed = fixed
+        self.labels = {}
+        if fixed:
+            self.labels = {re.escape(p): p for p in ([pattern] if pattern else []) + list(patterns or [])}
+            pattern = re.escape(pattern) if pattern else pattern
+            patterns = [re.escape(p) for p in patterns] if patterns else patterns
+        self.pset = None
+        if patterns:
+            self.pset = pattern_set(patterns = ([pattern] if pattern else []) + list(patterns))
+            pattern = self.pset.combined
         self.pattern = pattern
+        self.chunksize = chunksize
+        self.workers = workers
+        self.fasta = fasta and _base_name(fl = fl).endswith(self.fa_ext)
+        self.revcomp = revcomp
+        self.tail = tail if self._tailable(fl = fl, fasta = fasta) else None
+        self.follow = follow
+        self.matches = []
+        self.rows = {}
         super().__init__()
 
     @classmethod
-    def _fl_parser(cls, fl: str, pat: str) -> (list | dict):
+    def _tailable(cls, fl: str, fasta: bool = False) -> bool:
+        """Check if a file can be scanned incrementally: only uncompressed text files, outside FASTA mode, can.
+
+        Args:
+            * `fl` (str): File name/path.
+            * `fasta` (bool, optional): FASTA mode. Defaults to False.
+
+        Returns:
+            `bool`: True if a tail_engine is used for the file.
+        """
+
+        name = _base_name(fl = fl)
+        return name.endswith(cls.txt_ext) and _compression(fl = fl) is None and not (fasta and name.endswith(cls.fa_ext))
+
+    @classmethod
+    def _txt_stream(cls, fl: str, pat: str) -> Iterator[tuple[int, str]]:
+        """Streaming parser for text files. The pattern is compiled once and the file is read
+        lazily, one line at a time, so memory stays bounded regardless of the file size.
+        Compressed files are decompressed on the fly.
+
+        If the pattern holds a literal (see _prefilter), the file is instead read in blocks of block_size
+        characters, which are scanned for the literal, see _block_lines. The regex only runs on the lines
+        holding the literal, or not at all for literal patterns. Literals held by more than literal_density of the
+        lines of the first block are searched line by line, as a lookup per hit then costs more.
+
+        Args:
+            * `fl` (str): File name/path.
+            * `pat` (str): Pattern to look for.
+
+        Yields:
+            `tuple[int, str]`: Line index and stripped line contents for every line matching the pattern.
+        """
+
+        lit, exact = _prefilter(pat = pat)
+        regex = re.compile(pat)
+        with _open_input(fl = fl, mode = "r") as txt:
+            block = txt.read(cls.block_size) if lit is not None else ''
+            if lit is None or block.count(lit) > cls.literal_density * (block.count('\n') + 1):
+                # Per hit lookups only pay off for literals on few lines, common ones are searched line by line.
+                head = block.split('\n')
+                cut = head.pop()    # Line cut by the end of the first block, completed by the next line of the file.
+                for index, line in enumerate(chain(head, [cut + next(txt, '')] if cut else [], txt)):
+                    line = line.rstrip('\n')
+                    if regex.search(line):
+                        yield index, line.strip()
+                return
+
+            index, carry = 0, ''
+            while True:
+                buf = carry + block
+                if block:   # Lines cut by the end of the block are carried over to the next one.
+                    cut = buf.rfind('\n') + 1
+                    buf, carry = buf[:cut], buf[cut:]
+                for i, line in _block_lines(buf, lit, None if exact else regex, dense = cls.literal_density):
+                    yield index + i, line
+                index += buf.count('\n')
+                if not block:
+                    return
+                block = txt.read(cls.block_size)
+
+    @staticmethod
+    def _sp_sep(fl: str) -> str:
+        """Get the delimiter of a spreadsheet file from its extension.
+
+        Args:
+            * `fl` (str): File name/path.
+
+        Returns:
+            `str`: Tab for .tsv files, comma otherwise.
+        """
+
+        return '\t' if _base_name(fl = fl).endswith('.tsv') else ','
+
+    @classmethod
+    def _sp_stream(cls, fl: str, pat: str, chunksize: int | None = None) -> Iterator[tuple[int, str, str]]:
+        """Vectorized in-memory search of a spreadsheet file. All cells of a block are matched against the pattern
+        at once and a cell is a match when the whole cell matches the pattern. Nothing is written to disk.
+        Literal patterns are matched by comparing the cells, other patterns only run on the cells holding their
+        literal, if any (see _prefilter).
+
+        When chunksize is set, the file is read in blocks of that many rows and matches are yielded block by block,
+        so peak memory scales with the chunk size and not with the file size. Compressed files are decompressed
+        on the fly by pandas. Otherwise, if the frames class attribute is set, parsed files are kept warm in it.
+
+        Args:
+            * `fl` (str): File name/path.
+            * `pat` (str): Pattern to look for.
+            * `chunksize` (int | None, optional): Number of rows per block. Defaults to None, the whole file is read at once.
+
+        Yields:
+            `tuple[int, str, str]`: Row index, column name and cell value for every matching cell, in row order.
+        """
+
+        import numpy as np
+        import pandas as pd
+        regex = re.compile(pat)
+        lit, exact = _prefilter(pat = pat)
+
+        def match(col):
+            if exact:
+                return col == lit
+            if lit is None:
+                return col.str.fullmatch(regex, na = False)
+            hit = col.str.contains(lit, regex = False, na = False)
+            if hit.any():
+                hit[hit] = col[hit].str.fullmatch(regex, na = False)
+            return hit
+
+        read = lambda: pd.read_csv(fl, sep = cls._sp_sep(fl = fl), dtype = str, keep_default_na = False,
+                                   encoding = 'utf-8-sig', chunksize = chunksize)
+        with _stage('read_csv'):
+            reader = cls.frames._load(fl = fl, read = read) if cls.frames is not None and chunksize is None else read()
+        reader = iter((reader,) if chunksize is None else reader)
+
+        while True:
+            with _stage('read_csv'):
+                chunk = next(reader, None)
+            if chunk is None:
+                break
+            with _stage('match.spreadsheet') as st:
+                mask = chunk.apply(match).to_numpy(dtype = bool)
+                rows, cols = np.nonzero(mask)
+                values = chunk.to_numpy()
+                st['items'] += len(rows)
+            for r, c in zip(rows, cols):
+                yield int(chunk.index[r]), chunk.columns[c], values[r, c]
+
+    @classmethod
+    def _txt_engine(cls, fl: str, pat: str, workers: int = 1) -> Iterator[tuple[int, str]]:
+        """Select the scan engine for a text file. If the file has an up to date trigram index and the pattern holds
+        a literal to narrow on, only the candidate lines from the index are scanned. Otherwise, with more than one worker, files from the parallel_threshold
+        class attribute onwards are split into byte ranges scanned in parallel. Otherwise, files smaller than the
+        mmap_threshold class attribute are streamed line by line, larger files are memory mapped and scanned as bytes.
+        Compressed files, and patterns whose candidate lines cannot be found in bytes (see mmap_engine._supports),
+        are always streamed line by line.
+
+        Args:
+            * `fl` (str): File name/path.
+            * `pat` (str): Pattern to look for.
+            * `workers` (int, optional): Number of worker processes. Defaults to 1.
+
+        Returns:
+            `Iterator[tuple[int, str]]`: Generator yielding line index and stripped line contents for every match.
+        """
+
+        if _compression(fl = fl) is not None:
+            return cls._txt_stream(fl = fl, pat = pat)
+
+        idx = trigram_index(fl = fl)
+        if idx._fresh():
+            indexed = idx._search(pat = pat)
+            if indexed is not None:
+                return indexed
+
+        size = os.path.getsize(fl)
+        if not mmap_engine._supports(pat = pat):     # Every line would be decoded and checked anyway.
+            return cls._txt_stream(fl = fl, pat = pat)
+        if workers > 1 and size >= cls.parallel_threshold:
+            return mmap_engine(fl = fl, pattern = pat)._parallel_scan(workers = workers)
+        if size >= cls.mmap_threshold:
+            return mmap_engine(fl = fl, pattern = pat)._scan()
+        return cls._txt_stream(fl = fl, pat = pat)
+
+    @classmethod
+    def _fl_parser(cls, fl: str, pat: str, chunksize: int | None = None, workers: int = 1) -> Iterator:
         """Parser method for parsing through files with extensions:
             * .txt
             * .ini
             * .fasta
             * .csv
             * .tsv
+        and their compressed .gz, .bz2, .xz and .zst versions.
 
         Args:
             * `fl` (str): File name/path.
             * `pat` (str): Pattern to look for.
+            * `chunksize` (int | None, optional): Number of rows per block for spreadsheet files. Defaults to None.
+            * `workers` (int, optional): Number of worker processes for large text files. Defaults to 1.
 
         Returns:
-            `list | dict`:  dictionary with all the data found and their corresponding locations in the file.
-                            If multiple matches are found on the same location in the file, the dictionary will be wrapped in 
-                            a list.
+            `Iterator`: For text files, a generator yielding (line index, line) tuples for every match.
+                        For spreadsheet files, a generator yielding (row index, column, value) tuples for every match.
         """
 
         assert fl, 'No file name or path was provided.'
         assert pat, 'No pattern was provided.'
 
+        base = _base_name(fl = fl)
         # Text Files.
-        if fl.endswith(cls.txt_ext):
-            data_found = []
-            with open(fl, "r") as txt:
-                lines = txt.readlines()
-                txt.seek(0)
-                for index, line in enumerate(lines):
-                    ln_index = str(index)+': '+line
-                    ln_index = ln_index.replace('\n', '')
-                    data_found.append(ln_index)
+        if base.endswith(cls.txt_ext):
+            return cls._txt_engine(fl = fl, pat = pat, workers = workers)
 
         # Spreadsheet Files.
-        elif fl.endswith(cls.sp_ext):
-            data_found = {}
-            with open(fl, "r", encoding = 'utf-8-sig') as csv_file:
-                csv_reader = csv.reader(csv_file, delimiter = ',')
-                headers = []
-
-                # loop through csv and get the first row (headers)
-                for row in csv_reader:
-                    headers.append(row)
-                    break
-                headers = [item for elem in headers for item in elem]
-
-                db_name = "tmp.db"
-
-            import sqlite3
-            con = sqlite3.connect(db_name)
-            cur = con.cursor()
-            pd.read_csv(fl).to_sql("Table_1", con, 
-                                        if_exists = 'replace', index = False)
-
-            for i in headers:
-                statement = f"SELECT * FROM Table_1 WHERE {i} LIKE '{pat}';"
-                cur.execute(statement)
-                result = cur.fetchall() # get all matches from column i
-                if len(result) == 0:
-                    continue
+        elif base.endswith(cls.sp_ext):
+            return cls._sp_stream(fl = fl, pat = pat, chunksize = chunksize)
+
+    def _iter_matches(self) -> Iterator[tuple]:
+        """Lazily iterate over the matches of the file. Matches are yielded as soon as they are found,
+        before the scan of the file finishes. With an incremental scan, only the new lines of the file are scanned.
+
+        Yields:
+            `tuple`: Line index and stripped line contents for text files.
+                     Row index, column name and cell value for spreadsheet files.
+        """
+
+        if self.tail is not None:
+            start = self.tail.offset
+            matches = self.tail._follow(pat = self.pattern) if self.follow else self.tail._scan(pat = self.pattern)
+            yield from _profiled('search.tail', matches, nbytes = max(os.path.getsize(self.fl) - start, 0))
+            return
+
+        stage = 'search.spreadsheet' if _base_name(fl = self.fl).endswith(self.sp_ext) else 'search.text'
+        yield from _profiled(stage, self._fl_parser(fl = self.fl, pat = self.pattern, chunksize = self.chunksize,
+                                                    workers = self.workers), nbytes = os.path.getsize(self.fl))
+
+    def _iter_records(self) -> Iterator[match_record]:
+        """Lazily iterate over the matches of the file as match records. Every matching cell of a spreadsheet
+        is a record. For multi-pattern queries, a match gets one record per pattern it matches.
+        Match offsets are relative to the reported line or cell. In FASTA mode, records come from fasta_engine.
+
+        Yields:
+            `match_record`: Match record.
+        """
+
+        if self.fasta:
+            pats = self.pset.patterns if self.pset is not None else [self.pattern]
+            records = _profiled('search.fasta', fasta_engine(fl = self.fl, patterns = pats, revcomp = self.revcomp)._search(),
+                                nbytes = os.path.getsize(self.fl))
+            if not self.labels:
+                yield from records
+                return
+            for r in records:
+                yield r._replace(pattern = self.labels.get(r.pattern, r.pattern))
+            return
+
+        spreadsheet = _base_name(fl = self.fl).endswith(self.sp_ext)
+        regex = re.compile(self.pattern)
+        # Offsets of a literal pattern are found with substring search, without running the regex again.
+        lit, exact = _prefilter(pat = self.pattern) if self.pset is None else (None, False)
+        label = self.labels.get(self.pattern, self.pattern)
+        for match in self._iter_matches():
+            if spreadsheet:
+                line, column, value = match
+            else:
+                (line, value), column = match, ''
+            if exact:
+                start = value.find(lit) if not spreadsheet or value == lit else -1
+                if start == -1:     # Literal holding whitespace stripped from the line.
+                    yield match_record(self.fl, label, line, column, None, None, None, value)
+                else:
+                    yield match_record(self.fl, label, line, column, start, start + len(lit), lit, value)
+                continue
+            if self.pset is None:
+                tags = [(self.pattern, regex.fullmatch(value) if spreadsheet else regex.search(value))]
+            else:
+                tags = self.pset._tags(text = value, full = spreadsheet)
+            for p, m in tags:
+                p = self.labels.get(p, p)
+                if m is None:   # Pattern anchored on whitespace stripped from the line.
+                    yield match_record(self.fl, p, line, column, None, None, None, value)
                 else:
-                    temp_lst = []
-                    for x in result:
-                        temp_lst = x
-                        for k in temp_lst:
-                            if k in pat:
-                                data_found[i] = k
-            os.remove(db_name) # Remove tmp db file.
-        return data_found
+                    yield match_record(self.fl, p, line, column, m.start(), m.end(), m.group(), value)
 
     def _get_matches(self) -> dict:
-        """Find the matches from a dictionary. If dictionary is wrapped in a list, it parses through the list elements
-        which will be dictionaries. Dictionary is generated from the _fl_parser class method.
+        """Find the matches in the file by consuming the match records of the streaming generators.
+        The records are kept in the matches attribute and, for spreadsheet files, the row indices of the matches
+        of every column are kept in the rows attribute.
 
         Raises:
             * `RegexError`: Custom error generated when no regex output is generated.
 
         Returns:
             `dict`: A dictionary with all the matching locations and their values.
+                    For multi-pattern queries, keys are the patterns and values are such dictionaries.
+        """
+
+        self._set_matches(records = list(self._iter_records()))
+        return _assemble(records = self.matches, multi_pattern = self.pset is not None)
+
+    def _set_matches(self, records: list[match_record]) -> None:
+        """Keep the match records of a query.
+
+        Args:
+            * `records` (list[match_record]): Match records.
+
+        Raises:
+            * `RegexError`: Custom error generated when no match is found in a text file.
         """
 
-        parser_out = self._fl_parser(fl = self.fl, pat = self.pattern)
-        found = {}
-        if isinstance(parser_out, list):
-            lst_str = ''.join(parser_out)
-            a = re.findall(self.pattern, lst_str)
-            if len(a) == 0:
-                raise RegexError(f"pattern: {self.pattern}, doesn't exist!")
-            for i in parser_out:
-                if re.search(self.pattern, i):
-                    key, value = i.split(':', 1)
-                    key = key.strip()
-                    value = value.strip()
-                    found[key] = value
-        else:
-            return parser_out
-
-        return found
\ No newline at end of file
+        self.matches = records
+        self.rows = {}
+        if _base_name(fl = self.fl).endswith(self.sp_ext):
+            for r in records:
+                self.rows.setdefault(r.column, []).append(r.line)
+        elif not records:
+            pats = self.pset.patterns if self.pset is not None else [self.pattern]
+            raise RegexError(f"pattern: {', '.join(pats)}, doesn't exist!")
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import os, json, asyncio
+from lib.query_parser import query_tool
+from lib.search_tool import search_tools
+from lib.cache import result_cache, frame_cache
+from lib.records import match_record, _assemble
+from lib.exceptions import RegexError, InputflError
+from lib.utils import dunders
+
+class query_server(dunders):
+    """Long running query service on a Unix domain socket, so that repeated queries skip the interpreter startup,
+    the imports and, where possible, the parsing of their files. The server keeps warm state in memory:
+        * Query results, in an LRU result_cache keyed on the file fingerprint, pattern and options.
+        * Parsed spreadsheet files, in an LRU frame_cache keyed on the file fingerprint.
+        * Compiled patterns, in the regex module cache of the process.
+    The trigram indexes next to the files are reused as in any run.
+
+    The protocol is newline delimited JSON, one request and one response per line, and a connection can send
+    any number of requests. A request is an object with the op key:
+        * `query`: fls (list of paths), pattern, patterns, chunksize, fasta, revcomp and fixed, as in query_tool.
+          The response holds results, one query_wrapper output per file, and the number of cache hits.
+        * `stats`: Number of requests served and cache statistics.
+        * `shutdown`: Stop the server.
+    Failed requests get {"ok": false, "error": exception name, "message": ...} and the connection stays open.
+    Queries of concurrent clients run in a pool of threads.
+
+    Args:
+        * `path` (str): Socket file name/path.
+        * `workers` (int | None, optional): Number of query threads. Defaults to None, chosen by asyncio.
+        * `cache_dir` (str | None, optional): Directory of the disk result cache. Defaults to None, in-process only.
+        * `max_bytes` (int, optional): Size cap of the disk result cache in bytes. Defaults to 256 MiB.
+        * `max_entries` (int, optional): Number of query results kept in memory. Defaults to 128.
+        * `max_frames` (int, optional): Number of parsed spreadsheet files kept in memory. Defaults to 16.
+    """
+
+    def __init__(self, path: str, workers: int | None = None, cache_dir: str | None = None,
+                max_bytes: int = 256 * 1024 ** 2, max_entries: int = 128, max_frames: int = 16) -> None:
+        self.path = path
+        self.workers = workers
+        self.cache = result_cache(cache_dir = cache_dir, max_bytes = max_bytes, max_entries = max_entries)
+        self.frames = frame_cache(max_entries = max_frames)
+        self.served = 0
+        self._stop = None
+        self._pool = None
+        super().__init__()
+
+    @staticmethod
+    def _run(fl: str, req: dict) -> list[match_record]:
+        """Run a query on a file, in a query thread.
+
+        Args:
+            * `fl` (str): File name/path.
+            * `req` (dict): Query request.
+
+        Raises:
+            RegexError: No match in a single file query.
+
+        Returns:
+            `list[match_record]`: Match records of the query.
+        """
+
+        query = query_tool(fl = fl, pattern = req.get('pattern', ''), chunksize = req.get('chunksize'),
+                           patterns = req.get('patterns'), fasta = req.get('fasta', False),
+                           revcomp = req.get('revcomp', False), fixed = req.get('fixed', False))
+        try:
+            query.query_wrapper(show_idx = False)
+        except RegexError:
+            if len(req['fls']) == 1:
+                raise
+            return []       # As in batch_query, files without matches get empty results.
+        return query.matches
+
+    async def _query_one(self, fl: str, req: dict) -> tuple[dict, bool]:
+        """Answer the query of a file from the result cache, or run it.
+
+        Args:
+            * `fl` (str): File name/path.
+            * `req` (dict): Query request.
+
+        Raises:
+            InputflError: The file does not exist.
+
+        Returns:
+            `tuple[dict, bool]`: Query results and whether they came from the cache.
+        """
+
+        if not os.path.isfile(fl):
+            raise InputflError(f'Input file {fl} does not exist.')
+
+        patterns = req.get('patterns')
+        multi_pattern = bool(patterns)
+        options = {'patterns': ([req['pattern']] if req.get('pattern') else []) + patterns if multi_pattern else None,
+                   'format': 'records', 'fasta': req.get('fasta', False), 'revcomp': req.get('revcomp', False),
+                   'fixed': req.get('fixed', False)}
+        key = self.cache._key(fl = fl, pattern = req.get('pattern', ''), options = options)
+        cached = self.cache._get(key = key)
+        if cached is not None:
+            return _assemble(records = [match_record(*r) for r in cached], multi_pattern = multi_pattern), True
+
+        records = await asyncio.get_running_loop().run_in_executor(self._pool, self._run, fl, req)
+        self.cache._put(key = key, value = records)
+        return _assemble(records = records, multi_pattern = multi_pattern), False
+
+    async def _answer(self, req: dict) -> dict:
+        """Answer a request.
+
+        Args:
+            * `req` (dict): Request.
+
+        Raises:
+            ValueError: Unknown operation.
+
+        Returns:
+            `dict`: Response.
+        """
+
+        op = req.get('op', 'query')
+        if op == 'stats':
+            return {'ok': True, 'served': self.served, 'cache': {'hits': self.cache.hits, 'misses': self.cache.misses,
+                    'entries': len(self.cache.mem)}, 'frames': {'hits': self.frames.hits,
+                    'misses': self.frames.misses, 'entries': len(self.frames.mem)}}
+        if op == 'shutdown':
+            self._stop.set()
+            return {'ok': True}
+        if op != 'query':
+            raise ValueError(f'Operation {op} is not supported. Supported operations are: query, stats, shutdown')
+
+        answers = await asyncio.gather(*(self._query_one(fl = fl, req = req) for fl in req['fls']))
+        self.served += 1
+        return {'ok': True, 'results': [out for out, _ in answers], 'cache_hits': sum(hit for _, hit in answers)}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve the requests of a client connection until it is closed.
+
+        Args:
+            * `reader` (asyncio.StreamReader): Connection input.
+            * `writer` (asyncio.StreamWriter): Connection output.
+        """
+
+        try:
+            while line := await reader.readline():
+                try:
+                    resp = await self._answer(req = json.loads(line))
+                except Exception as e:      # Reported to the client, the server keeps running.
+                    resp = {'ok': False, 'error': type(e).__name__, 'message': str(e)}
+                writer.write(json.dumps(resp).encode('utf-8') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _serve(self) -> None:
+        """Listen on the socket until a shutdown request."""
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._stop = asyncio.Event()
+        if os.path.exists(self.path):       # Left over by a server that did not shut down cleanly.
+            os.remove(self.path)
+        server = await asyncio.start_unix_server(self._handle, path = self.path, limit = 16 * 1024 ** 2)
+        os.chmod(self.path, 0o600)
+        try:
+            with ThreadPoolExecutor(max_workers = self.workers) as self._pool:
+                async with server:
+                    await self._stop.wait()
+        finally:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def run(self) -> None:
+        """Run the server until a shutdown request or an interrupt. Parsed spreadsheet files are kept warm for
+        every query of the process while it runs."""
+
+        prev, search_tools.frames = search_tools.frames, self.frames
+        try:
+            asyncio.run(self._serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            search_tools.frames = prev
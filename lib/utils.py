@@ -1,8 +1,7 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
-import os
-from inspect import getfullargspec
+import shutil
 
 def yml_parser(f: str) -> dict:
     """Parser for a .yml file.
@@ -26,7 +25,7 @@ def terminal_str_formatter(_str_: str) -> str:
     Returns:
         `str`: Formatted str.
     """
-    terminal_width = os.get_terminal_size().columns
+    terminal_width = shutil.get_terminal_size().columns
     return f'\033[1m{_str_}\033[0m'.center(terminal_width)
 
 class dunders:
@@ -35,6 +34,7 @@ class dunders:
 
     @classmethod
     def __repr__(cls) -> str:
+        from inspect import getfullargspec
         params = getfullargspec(__class__).args
         try:
             params.remove("self")
@@ -1,11 +1,23 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
-import argparse, os
+import argparse, os, re
 from lib.query_parser import query_tool
-from lib.json_db import json_db, _fl_nm_parser
+from lib.batch import batch_query, _expand_inputs
+from lib.index import trigram_index
+from lib.cache import result_cache
+from lib.patterns import _read_patterns
+from lib.compression import _base_name, _compression
+from lib.exceptions import InputflError, RegexError
+from lib.json_db import json_db, pg_pool, _fl_nm_parser
+from lib.records import match_record
+from lib.jsonl import jsonl_writer
+from lib.columnar import columnar_writer
+from lib.profiler import stage_profiler, _stage
+from lib.follow import tail_engine, checkpoint_store
+from lib.client import query_client
 from lib.utils import terminal_str_formatter
-from typing import Any, Final
+from typing import Any, Final, Iterable
 
 def args_parser(msg: str) -> argparse.Namespace:
     """Custom argument parser.
@@ -18,20 +30,73 @@ def args_parser(msg: str) -> argparse.Namespace:
     """
 
     PARSER: Final[object] = argparse.ArgumentParser(description = msg, formatter_class = argparse.RawDescriptionHelpFormatter)
-    PARSER.add_argument("-f", help = "Input file.")
+    PARSER.add_argument("-f", nargs = '+', help = "Input file(s). Directories and glob patterns are also accepted, results of multiple files are keyed by file.")
+    PARSER.add_argument("-w", type = int, help = "Optional argument: Number of worker processes when querying multiple files, or when scanning a single large text file in parallel byte ranges. Defaults to the number of cores.")
     PARSER.add_argument("-p", help = "Pattern to look for. If the file is a txt type file, specify a string pattern. If the file is a .csv or .tsv file, specify a csv file containing the patterns to look for.")
+    PARSER.add_argument("-pf", help = "Optional argument: File with patterns to look for, one per line (or one per cell for a .csv or .tsv pattern file). All patterns, together with -p if set, are matched in a single pass and the results are keyed by pattern.")
+    PARSER.add_argument("-fixed", action = 'store_true', help = "Optional argument: Treat -p and -pf patterns as literal strings instead of regexes, like grep -F. Literal patterns are found with plain substring search, without the regex engine.")
+    PARSER.add_argument("-chunk", type = int, help = "Optional argument: Read .csv or .tsv files in blocks of this many rows, so memory use scales with the block size instead of the file size.")
+    PARSER.add_argument("-fasta", action = 'store_true', help = "Optional argument: Search .fasta files record by record. Wrapped sequence lines are joined, so matches spanning line breaks are found, headers and sequences are searched separately and matches are reported as record id and sequence offset.")
+    PARSER.add_argument("-revcomp", action = 'store_true', help = "Optional argument: With -fasta, also search the reverse complement of every sequence in the same pass. Reverse strand matches are reported with forward strand offsets.")
+    PARSER.add_argument("-index", action = 'store_true', help = "Optional argument: Build a trigram index next to every input text file (file.qidx). Later queries on an unchanged file use the index to only scan candidate lines. Without -p or -pf, the tool exits after indexing.")
+    PARSER.add_argument("-cache", nargs = '?', const = result_cache.default_dir, help = "Optional argument: Cache query results on disk, keyed on the file fingerprint and the pattern. Unchanged files skip parsing on later runs. Optionally takes the cache directory, defaults to ~/.cache/query-tool.")
+    PARSER.add_argument("-cache_size", type = int, default = 256, help = "Optional argument: Size cap of the disk cache in MB, least recently used results are evicted first. Default is 256.")
     PARSER.add_argument("-o", help = "Optional argument: Output directory for .json file and sqlite3 .db file. Does not work on postgres 4")
     PARSER.add_argument("-json", action = 'store_true' , help = "Optional argument: Export into .json file format. Key is either the lines the pattern was found in (for .txt type files) or the columns (for .csv or .tsv files).")
-    PARSER.add_argument("-jname", help = "Optional argument: If -json flag is set, this flag is used to give a name to the .json output file. Default is None.")
-    PARSER.add_argument("-db", action = 'store_true', help = "Optional argument: Write the .json output file in a new database when option -json is used. If -pg option is not set, the database will be sqlite3")
+    PARSER.add_argument("-jsonl", action = 'store_true', help = "Optional argument: Stream the matches into a JSON Lines (.jsonl) file, one JSON object per match, written as soon as it is found. Memory use stays constant whatever the number of matches. Can be combined with -db.")
+    PARSER.add_argument("-compress", choices = list(jsonl_writer.comp_ext), help = "Optional argument: Compress the -jsonl output with gzip or zstd. zstd needs the zstandard package.")
+    PARSER.add_argument("-columnar", choices = list(columnar_writer.fmt_ext), help = "Optional argument: Write the matches into a typed columnar file, parquet (compressed, smallest) or feather (Arrow IPC, memory mapped without copies on load), written in batches as they are found. Loads straight into pandas with read_parquet/read_feather. Needs the pyarrow package.")
+    PARSER.add_argument("-jname", help = "Optional argument: Name of the .json output file and of the database. Default is None, the name of the input file.")
+    PARSER.add_argument("-db", action = 'store_true', help = "Optional argument: Write the matches in a new database. Without -json, matches are streamed straight into the database. If -pg option is not set, the database will be sqlite3")
 
-    PARSER.add_argument("-pg", help = "Optional argument: Write the .json output file in a new postgres 4 database when option -json is used."
+    PARSER.add_argument("-pg", help = "Optional argument: Write the matches in a new postgres 4 database when option -db is used."
                         "This argument needs the name of the .ini file that has the postgres database information. Check the template.ini file "
                         "for more info for the .ini organization.")
 
+    PARSER.add_argument("-append", action = 'store_true', help = "Optional argument: With -db, reuse an existing database and table instead of creating new ones. Matches are upserted on (source file, location, pattern) and only input files that changed since the last run with the same patterns are queried.")
+    PARSER.add_argument("-follow", action = 'store_true', help = "Optional argument: Follow a single text file like tail -f. Matches are printed (and written to -jsonl/-columnar outputs) as lines are appended, until Ctrl+C. Rotated or truncated files are picked up from their start. Combined with -resume, following starts from the checkpoint.")
+    PARSER.add_argument("-resume", nargs = '?', const = checkpoint_store.default_path, help = "Optional argument: Only scan the lines appended to text files since the last run with the same patterns, and store the byte offset and line reached for the next run. Rotated (new inode) or truncated files are scanned from the start. Optionally takes the checkpoint file, defaults to ~/.cache/query-tool/checkpoints.json.")
+    PARSER.add_argument("-serve", nargs = '?', const = query_client.default_path, help = "Optional argument: Run as a long running query server on a Unix socket, until Ctrl+C. Query results (with -cache also on disk, capped by -cache_size) and parsed .csv/.tsv files are kept warm in memory with LRU eviction, and queries of concurrent clients run in -w threads. Optionally takes the socket file, defaults to query-tool-<uid>.sock in the temporary directory.")
+    PARSER.add_argument("-connect", nargs = '?', const = query_client.default_path, help = "Optional argument: Forward the query (-f, -p, -pf, -chunk, -fasta, -revcomp) to a server started with -serve, and print (-inf) or write (-json) its results. Saves the imports and parsing of a full run. Optionally takes the socket file, defaults to the one of -serve.")
+    PARSER.add_argument("-profile", nargs = '?', const = '-', help = "Optional argument: Time the stages of the run (file reading and matching, read_csv, cache lookups, .json output, database inserts) and print a summary with wall time, bytes, matches and peak memory growth per stage. Optionally takes a .json file to write the stage totals into.")
+    PARSER.add_argument("-cprofile", help = "Optional argument: Run under cProfile and write the stats into this file, to be read with pstats or snakeviz. Also prints the stage summary of -profile.")
     PARSER.add_argument("-inf", action = 'store_true', help = "Optional argument: Display information about findings in the stdout.")
     return PARSER.parse_args()
 
+def db_writer(sink: json_db, rows: Iterable[match_record], out: str | None, sources: list[str],
+              kept: list[str] | None = None) -> None:
+    """Write query results into the database of a json_db sink.
+
+    Args:
+        * `sink` (json_db): Database sink.
+        * `rows` (Iterable[match_record]): Match records.
+        * `out` (str | None): Output directory of the sqlite3 .db file.
+        * `sources` (list[str]): Queried files.
+        * `kept` (list[str] | None, optional): Queried files whose previous rows are kept, see json_db.ingest. Defaults to None.
+    """
+
+    if sink.db_type == 'postgres':
+        print('Insertion of keys and values into a postgres4 database.')
+        output = sink.ingest(rows = rows, out = out, sources = sources, kept = kept)
+        print(f'Operation Complete! Data parsed into the {output} database.')
+    else:
+        print('Insertion of keys and values into a sqlite3 database.')
+        sink.ingest(rows = rows, out = out, sources = sources, kept = kept)
+        print('Operation Complete!')
+
+def json_writer(out: dict, fl: str) -> None:
+    """Write query results into a .json file.
+
+    Args:
+        * `out` (dict): Query results.
+        * `fl` (str): Output file name/path.
+    """
+
+    import json
+    with _stage('json.dump') as st, open(fl, 'w') as json_file:
+        json.dump(out, json_file, default = lambda o: o.__dict__, sort_keys = True, indent = 2)
+        st['bytes'] = json_file.tell()
+
 def main():
     MESSAGE = ("\n\nReturns a python dictionary with keys being all the lines/columns" 
     "\nthat a pattern was found and the lines/cells themselves as values.\nSet -json "
@@ -43,46 +108,234 @@ def main():
     print('\n')
     ARGS_NAMESPACE: argparse.Namespace = args_parser(msg = MESSAGE)
     ARGUMENTS: dict[str, Any] = vars(ARGS_NAMESPACE)
-    FILE: str | None = ARGUMENTS.get('f')
+    PROFILE: str | None = ARGUMENTS.get('profile')
+    CPROFILE: str | None = ARGUMENTS.get('cprofile')
+    if not PROFILE and not CPROFILE:
+        return run_query(ARGUMENTS = ARGUMENTS)
+
+    with stage_profiler() as PROFILER:
+        if CPROFILE:
+            import cProfile
+            prof = cProfile.Profile()
+            prof.runcall(run_query, ARGUMENTS = ARGUMENTS)
+            prof.dump_stats(CPROFILE)
+        else:
+            run_query(ARGUMENTS = ARGUMENTS)
+
+    print(f'Profile of the run:\n{PROFILER._summary()}\n')
+    if CPROFILE:
+        print(f'cProfile stats written to {CPROFILE}, e.g. python -m pstats {CPROFILE}')
+    if PROFILE and PROFILE != '-':
+        print(f'Stage profile written to {PROFILER._dump(fl = PROFILE)}')
+
+def run_query(ARGUMENTS: dict[str, Any]) -> None:
+    """Run the query described by the command line arguments.
+
+    Args:
+        * `ARGUMENTS` (dict[str, Any]): Input arguments, see args_parser.
+    """
+
+    SERVE: str | None = ARGUMENTS.get('serve')
+    if SERVE:
+        from lib.server import query_server
+        print(f'Serving queries on {SERVE}, Ctrl+C to stop...')
+        query_server(path = SERVE, workers = ARGUMENTS.get('w'), cache_dir = ARGUMENTS.get('cache'),
+                     max_bytes = ARGUMENTS.get('cache_size') * 1024 ** 2).run()
+        print('\nServer stopped, exiting...\n')
+        return
+
+    FILES: list[str] | None = ARGUMENTS.get('f')
     PATTERN: str | None = ARGUMENTS.get('p')
     OUTPUT: str | None = ARGUMENTS.get('o')
     JSON: bool = ARGUMENTS.get('json')
     JSON_NAME: str | None = ARGUMENTS.get('jname')
+    JSONL: bool = ARGUMENTS.get('jsonl')
+    COMPRESS: str | None = ARGUMENTS.get('compress')
+    COLUMNAR: str | None = ARGUMENTS.get('columnar')
     JSON_DB: bool = ARGUMENTS.get('db')
     JSON_POSTGRES: str | None = ARGUMENTS.get('pg')
     INFO: bool = ARGUMENTS.get('inf')
+    CHUNK: int | None = ARGUMENTS.get('chunk')
+    WORKERS: int | None = ARGUMENTS.get('w')
+    PATTERN_FILE: str | None = ARGUMENTS.get('pf')
+    PATTERNS: list[str] | None = _read_patterns(fl = PATTERN_FILE) if PATTERN_FILE else None
+    FIXED: bool = ARGUMENTS.get('fixed')
+    if not FILES:
+        raise InputflError('No input file was provided, use option -f.')
+    FILE: str | None = FILES[0] if len(FILES) == 1 and os.path.isfile(FILES[0]) else None
+    FASTA: bool = ARGUMENTS.get('fasta')
+    REVCOMP: bool = ARGUMENTS.get('revcomp')
+    FOLLOW: bool = ARGUMENTS.get('follow')
+    RESUME: str | None = ARGUMENTS.get('resume')
+    INDEX: bool = ARGUMENTS.get('index')
+    APPEND: bool = ARGUMENTS.get('append')
+    CACHE_DIR: str | None = ARGUMENTS.get('cache')
+    CACHE: result_cache | None = None
+    if CACHE_DIR:
+        CACHE = result_cache(cache_dir = CACHE_DIR, max_bytes = ARGUMENTS.get('cache_size') * 1024 ** 2)
+    PATS: list[str] = ([PATTERN] if PATTERN else []) + (PATTERNS or [])
+    # Checkpoints are kept per scanned pattern, apart from the regexes of the same strings.
+    SCANNED: list[str] = [re.escape(p) for p in PATS] if FIXED else PATS
+    CHECKPOINTS: checkpoint_store | None = checkpoint_store(path = RESUME) if RESUME else None
+    TAIL: tail_engine | None = CHECKPOINTS._tail(fl = FILE, patterns = SCANNED) if CHECKPOINTS and FILE else None
+    if FOLLOW and not FILE:
+        raise InputflError('-follow needs a single input file.')
 
-    out: dict = query_tool(fl = FILE, pattern = PATTERN).query_wrapper(show_idx = INFO)
-    if JSON:
-        if not JSON_NAME == None or JSON_NAME == 'None':
-            json_n = _fl_nm_parser(flstr = JSON_NAME, f_type = "json")
-        else:
-            json_n = _fl_nm_parser(flstr = FILE, f_type = "json")
+    if INDEX:
+        for fl in _expand_inputs(inputs = FILES, exts = query_tool.txt_ext):
+            if _compression(fl = fl) is not None:
+                print(f'Skipping {fl}: compressed files are streamed and cannot be indexed.')
+                continue
+            print(f'Indexing {fl}: {trigram_index(fl = fl)._build()}')
+        if not PATTERN and not PATTERN_FILE:
+            print('\nIndexing completed successfully, exiting...\n')
+            return
 
-        import json
-        if OUTPUT:
-            if os.path.isdir(OUTPUT):
-                json_n = os.path.join(OUTPUT, json_n)
-            else:
-                os.makedirs(OUTPUT)
-                json_n = os.path.join(OUTPUT, json_n)
+    if not JSON_NAME == None or JSON_NAME == 'None':
+        out_name = _fl_nm_parser(flstr = JSON_NAME, f_type = "json")
+    elif FILE:
+        out_name = _fl_nm_parser(flstr = _base_name(fl = FILE), f_type = "json")
+    else:
+        out_name = _fl_nm_parser(flstr = "query_results", f_type = "json")
 
-        with open(json_n, 'w') as json_file:
-            json.dump(out, json_file, default = lambda o: o.__dict__, sort_keys = True, indent = 2)
+    if OUTPUT and not os.path.isdir(OUTPUT):
+        os.makedirs(OUTPUT)
 
-        if JSON_DB:
-            if not JSON_POSTGRES == None or JSON_POSTGRES == 'None':
-                print('Insertion of .json keys and values into a postgres4 database.')
-                output = json_db(db_type = 'postgres', jsonf = json_n, ini = JSON_POSTGRES).invoker(out = OUTPUT)
-                print(f'Operation Complete! Data parsed into the {output} database.')
+    CONNECT: str | None = ARGUMENTS.get('connect')
+    if CONNECT:
+        if JSON_DB or JSONL or COLUMNAR or FOLLOW or RESUME:
+            raise InputflError('-connect only supports the -inf and -json outputs.')
+        FLS: list[str] = [FILE] if FILE else _expand_inputs(inputs = FILES, exts = query_tool.txt_ext + query_tool.sp_ext)
+        with query_client(path = CONNECT) as client:
+            results: list[dict] = client.query(fls = FLS, pattern = PATTERN, patterns = PATTERNS, chunksize = CHUNK,
+                                               fasta = FASTA, revcomp = REVCOMP, fixed = FIXED)
+        out: dict = results[0] if FILE else dict(zip(FLS, results))
+        if INFO:
+            for fl, found in zip(FLS, results):
+                print(f"{fl}: {len(found)} matches to the pattern: {PATTERN}")
+        if JSON:
+            json_writer(out = out, fl = os.path.join(OUTPUT, out_name) if OUTPUT else out_name)
+        print(f'\n{client.cache_hits} of {len(FLS)} results served from the server cache.')
+        print('\nQuery completed successfully, exiting...\n')
+        return
+
+    SINK: json_db | None = None
+    SOURCES: list[str] = []
+    KEPT: list[str] = []
+    if JSON_DB:
+        SOURCES = [FILE] if FILE else _expand_inputs(inputs = FILES, exts = query_tool.txt_ext + query_tool.sp_ext)
+        pg = not JSON_POSTGRES == None or JSON_POSTGRES == 'None'
+        SINK = json_db(db_type = 'postgres' if pg else 'sqlite', jsonf = out_name, ini = JSON_POSTGRES if pg else None,
+                       append = APPEND, patterns = PATS, fixed = FIXED,
+                       pool = pg_pool(ini = JSON_POSTGRES) if pg else None)
+        if APPEND:
+            changed = SINK._changed(fls = SOURCES, out = OUTPUT)
+            print(f'{len(changed)} of {len(SOURCES)} input files changed since the last run.')
+            if not changed:
+                if SINK.pool is not None:
+                    SINK.pool.close()
+                print('\nNothing to ingest, exiting...\n')
+                return
+            if FILE is None:
+                FILES = changed
+            SOURCES = changed
+            if CHECKPOINTS is not None:
+                # Files resumed from their checkpoint are only scanned past it, their older rows stay in the table.
+                KEPT = [fl for fl in SOURCES if query_tool._tailable(fl = fl, fasta = FASTA)
+                        and CHECKPOINTS._tail(fl = fl, patterns = SCANNED)._resumes()]
+
+    WRITERS: list[jsonl_writer | columnar_writer] = []
+    if JSONL:
+        jsonl_n = _fl_nm_parser(flstr = out_name, f_type = "jsonl")
+        WRITERS.append(jsonl_writer(fl = os.path.join(OUTPUT, jsonl_n) if OUTPUT else jsonl_n, compression = COMPRESS))
+    if COLUMNAR:
+        col_n = _fl_nm_parser(flstr = out_name, f_type = columnar_writer.fmt_ext[COLUMNAR].lstrip('.'))
+        WRITERS.append(columnar_writer(fl = os.path.join(OUTPUT, col_n) if OUTPUT else col_n, fmt = COLUMNAR))
+
+    if FOLLOW:
+        # Matches are printed and streamed into the output files as lines are appended, until interrupted.
+        query = query_tool(fl = FILE, pattern = PATTERN, patterns = PATTERNS, tail = TAIL or tail_engine(fl = FILE), follow = True,
+                           fixed = FIXED)
+        if query.tail is None:
+            raise InputflError(f'Input file: {FILE} cannot be followed, only uncompressed text files can.')
+        if JSON or JSON_DB:
+            print('Matches of -follow are only written to stdout and to -jsonl/-columnar outputs.')
+        chain = [query._iter_records()]
+        for writer in WRITERS:
+            if isinstance(writer, jsonl_writer):
+                writer.flush_every = 1
             else:
-                print('Insertion of .json keys and values into a sqlite3 database.')
-                json_db(db_type = 'sqlite', jsonf = json_n).invoker(out = OUTPUT)
-                print('Operation Complete!')
+                writer.batch_size = 1
+            chain.append(writer._tee(records = chain[-1]))
+        print(f'Following {FILE}, press Ctrl+C to stop.\n')
+        try:
+            for r in chain[-1]:
+                print(f'{r.line}: {r.value}', flush = True)
+        except KeyboardInterrupt:
+            pass
+        finally:    # Output files are completed and closed before their counts are reported.
+            for records in reversed(chain):
+                records.close()
+
+    elif (JSON_DB or WRITERS) and not JSON:
+        # Matches are streamed from the search generators straight into the output files and/or the database.
+        if FILE:
+            query = query_tool(fl = FILE, pattern = PATTERN, chunksize = CHUNK, workers = WORKERS or os.cpu_count() or 1,
+                               patterns = PATTERNS, fasta = FASTA, revcomp = REVCOMP, tail = TAIL, fixed = FIXED)
+        else:
+            query = batch_query(fls = FILES, pattern = PATTERN, workers = WORKERS, chunksize = CHUNK,
+                                patterns = PATTERNS, fasta = FASTA, revcomp = REVCOMP, checkpoints = CHECKPOINTS, fixed = FIXED)
+        records = query._iter_records()
+        for writer in WRITERS:
+            records = writer._tee(records = records)
+        if JSON_DB:
+            db_writer(sink = SINK, rows = records, out = OUTPUT, sources = SOURCES, kept = KEPT)
+        else:
+            for _ in records:
+                pass
+
+    else:
+        if FILE:
+            query = query_tool(fl = FILE, pattern = PATTERN, chunksize = CHUNK, workers = WORKERS or os.cpu_count() or 1,
+                               patterns = PATTERNS, cache = CACHE, fasta = FASTA, revcomp = REVCOMP, tail = TAIL, fixed = FIXED)
+            try:
+                out: dict = query.query_wrapper(show_idx = INFO)
+            except RegexError:
+                if query.tail is None:
+                    raise
+                out = {}    # No match in the lines appended since the checkpoint.
+                print('No new matches since the last run.')
+        else:
+            query = batch_query(fls = FILES, pattern = PATTERN, workers = WORKERS, chunksize = CHUNK, patterns = PATTERNS,
+                                cache = CACHE, fasta = FASTA, revcomp = REVCOMP, checkpoints = CHECKPOINTS, fixed = FIXED)
+            out: dict = query.run()
+            if INFO:
+                for fl, matches in out.items():
+                    print(f"{fl}: {len(matches)} matches to the pattern: {PATTERN}")
+
+        if JSON:
+            json_writer(out = out, fl = os.path.join(OUTPUT, out_name) if OUTPUT else out_name)
+
+        for writer in WRITERS:
+            writer.write(records = query.matches)
 
-    if not JSON:
         if JSON_DB:
-            raise RuntimeError("Option -db was used without setting option -json as True.")
+            db_writer(sink = SINK, rows = query.matches, out = OUTPUT, sources = SOURCES, kept = KEPT)
+
+    if SINK is not None and SINK.pool is not None:
+        SINK.pool.close()
+
+    if CHECKPOINTS is not None:
+        if FILE and query.tail is not None:
+            CHECKPOINTS._put(patterns = SCANNED, tail = query.tail)
+        print(f'\nCheckpoints saved to {CHECKPOINTS._save()}.')
+
+    for writer in WRITERS:
+        print(f'\n{writer.count} matches written to {writer.fl}.')
+
+    if CACHE is not None:
+        stats = CACHE._stats()
+        print(f"\nResult cache: {stats['hits']} hits, {stats['misses']} misses.")
 
     print('\nQuery completed successfully, exiting...\n')
 if __name__ == "__main__":
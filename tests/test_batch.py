@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+from lib.batch import batch_query
+
+def test_parallel_batch(tmp_path):
+    """Files queried in worker processes give the same results as a serial run."""
+
+    fls = []
+    for i in range(2):
+        fl = tmp_path / f'log{i}.txt'
+        fl.write_text(f'error {i}\nok\nerror again\n')
+        fls.append(str(fl))
+
+    serial = batch_query(fls = fls, pattern = 'error', workers = 1).run()
+    parallel = batch_query(fls = fls, pattern = 'error', workers = 2).run()
+    assert parallel == serial
+    assert parallel[fls[1]] == {'0': 'error 1', '2': 'error again'}
@@ -0,0 +1,19 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import pytest
+from lib.columnar import columnar_writer
+from lib.records import match_record
+
+def test_pending_batch_written_on_close(tmp_path):
+    """Records of a partial batch are written when the stream is closed early, e.g. on Ctrl+C in follow mode."""
+
+    pq = pytest.importorskip('pyarrow.parquet')
+    writer = columnar_writer(fl = str(tmp_path / 'out'), fmt = 'parquet')
+    records = (match_record('log.txt', 'err', i, '', 0, 3, 'err', f'err {i}') for i in range(3))
+    tee = writer._tee(records = records)
+    next(tee)
+    next(tee)
+    tee.close()
+    assert writer.count == 2
+    assert pq.read_table(writer.fl).column('line').to_pylist() == [0, 1]
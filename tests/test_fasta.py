@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+from lib.fasta import fasta_engine
+
+def test_header_matches_have_distinct_keys(tmp_path):
+    """Every header match of a record gets its own location key, so none collapses in the results or the database."""
+
+    fl = tmp_path / 'r.fasta'
+    fl.write_text('>id1 ACGT ACGT\nTTTT\n')
+    records = [r for r in fasta_engine(fl = str(fl), patterns = ['ACGT'])._search() if ':header' in r.column]
+    assert [r.column for r in records] == ['id1:header:4', 'id1:header:9']
+
+def test_patterns_in_one_pass(tmp_path):
+    """Patterns searched together give the matches of every pattern searched on its own, overlapping ones included."""
+
+    fl = tmp_path / 'r.fasta'
+    fl.write_text('>id1 ACGT desc\nACGTTACG\nCGTAAAC\n>id2\nTTACGCGTAC\n>id3 empty\n')
+    pats = ['ACG', 'CGT', 'A+', 'G[AT]', '(?i)tt', '^AC', 'C$', 'desc']
+    together = fasta_engine(fl = str(fl), patterns = pats, revcomp = True)._search()
+    alone = [r for p in pats for r in fasta_engine(fl = str(fl), patterns = [p], revcomp = True)._search()]
+    assert sorted(together) == sorted(alone)
+    assert {r.pattern for r in alone} == set(pats)
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import pytest
+from lib.index import trigram_index
+from lib.search_tool import search_tools
+
+@pytest.mark.parametrize('pat', ['foo$', '^foo$', 'line$', r'ler\s\w+$', 'ée$'])
+def test_index_crlf(tmp_path, pat):
+    """Indexed queries of a CRLF file report the same lines as unindexed ones."""
+
+    fl = tmp_path / 't.txt'
+    fl.write_bytes(('née\r\nfoo\r\n' + 'filler line\r\n' * 40).encode('utf-8') * 20)
+    expected = list(search_tools._txt_stream(fl = str(fl), pat = pat))
+    assert expected
+    idx = trigram_index(fl = str(fl))
+    idx._build()
+    found = idx._search(pat = pat)
+    assert found is not None
+    assert list(found) == expected
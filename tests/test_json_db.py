@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import pytest
+from lib.json_db import json_db, pg_pool
+from lib.records import match_record
+
+class fake_cursor:
+    """Cursor of a stand-in connection, recording the statements it runs. execute_values and execute_batch
+    build their statements with mogrify."""
+
+    def __init__(self, conn) -> None:
+        self.connection = conn
+
+    def execute(self, sql, args = None) -> None:
+        self.connection.log.append(sql.decode() if isinstance(sql, bytes) else sql)
+
+    def mogrify(self, sql, args) -> bytes:
+        return (sql if isinstance(sql, bytes) else sql.encode()) + repr(args).encode()
+
+    def fetchone(self):
+        return None
+
+class fake_conn:
+    encoding = 'UTF8'
+
+    def __init__(self, log: list, **params) -> None:
+        self.log = log
+        self.params = params
+        self.autocommit = False
+
+    def cursor(self) -> fake_cursor:
+        return fake_cursor(self)
+
+    def commit(self) -> None:
+        pass
+
+    def rollback(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+class fake_pool:
+    def __init__(self, log: list, minconn: int, maxconn: int, **params) -> None:
+        self.log = log
+        self.params = params
+        self.opened = 0
+
+    def getconn(self) -> fake_conn:
+        self.opened += 1
+        return fake_conn(self.log, **self.params)
+
+    def putconn(self, conn) -> None:
+        pass
+
+    def closeall(self) -> None:
+        pass
+
+def test_pool_sets_up_once(tmp_path):
+    """Sinks sharing a pool create the database and the tables once."""
+
+    pytest.importorskip('psycopg2')     # Rows are still sent through psycopg2.extras.
+    ini = tmp_path / 'pg.ini'
+    ini.write_text('[INFO]\ndatabase = bench\npguser = u\npgpswd = p\npghost = localhost\npgport = 5432\n')
+    log = []
+    pool = pg_pool(ini = str(ini), connect = lambda **kw: fake_conn(log, **kw),
+                   pool_factory = lambda minconn, maxconn, **kw: fake_pool(log, minconn, maxconn, **kw))
+    for fl in ('a.txt', 'b.txt'):
+        sink = json_db(db_type = 'postgres', jsonf = 'out.json', ini = str(ini), patterns = ['error'], pool = pool)
+        sink.ingest(rows = [match_record(fl, 'error', 0, '', 0, 5, 'error', 'error 1')])
+
+    assert sum(s.startswith('CREATE database') for s in log) == 1
+    assert sum(s.startswith('CREATE TABLE') for s in log) == 2      # Matches and fingerprints tables.
+    assert sum(s.lstrip().startswith('INSERT INTO out_table ') for s in log) == 2
+    assert pool.pool.params['dbname'] == 'bench'
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import pytest
+from lib.mmap_engine import mmap_engine
+from lib.search_tool import search_tools
+
+TEXT = 'x 12\n34 y\nfoo \n\nab\ncd\n lead\nlast line'
+PATTERNS = [r'\d+\s+\d+', r'ab\s', r'[^a]*d', r'\s+$', r'^\s', r'line$', r'\n', 'foo', r'y$']
+
+@pytest.mark.parametrize('pat', PATTERNS)
+def test_scan_matches_stream(tmp_path, pat):
+    """The mmap scan reports the same lines as the line by line parser, matches never span lines."""
+
+    fl = tmp_path / 't.txt'
+    fl.write_text(TEXT)
+    expected = list(search_tools._txt_stream(fl = str(fl), pat = pat))
+    assert list(mmap_engine(fl = str(fl), pattern = pat)._scan()) == expected
+
+@pytest.mark.parametrize('pat', PATTERNS)
+def test_parallel_scan_matches_stream(tmp_path, pat):
+    """Byte ranges scanned in parallel report the same lines as the line by line parser, with global line indices."""
+
+    fl = tmp_path / 't.txt'
+    fl.write_text(TEXT)
+    expected = list(search_tools._txt_stream(fl = str(fl), pat = pat))
+    assert list(mmap_engine(fl = str(fl), pattern = pat)._parallel_scan(workers = 3)) == expected
+
+UNICODE = 'café\nnaïve word\nplain\nÉcole\n'
+UNICODE_PATTERNS = [r'^.{4}$', r'caf\w', r'\w+ve', '(?i)école', '[éï]', r'\bword', 'ï', 'pla[a-z]+']
+
+@pytest.mark.parametrize('pat', UNICODE_PATTERNS)
+def test_scan_non_ascii(tmp_path, pat):
+    """Non-ASCII lines and patterns give the same results as the line by line parser, in every engine."""
+
+    fl = tmp_path / 't.txt'
+    fl.write_text(UNICODE, encoding = 'utf-8')
+    expected = list(search_tools._txt_stream(fl = str(fl), pat = pat))
+    assert expected
+    assert list(mmap_engine(fl = str(fl), pattern = pat)._scan()) == expected
+    assert list(mmap_engine(fl = str(fl), pattern = pat)._parallel_scan(workers = 3)) == expected
+
+CRLF_PATTERNS = ['foo$', '^foo$', r'\d$', 'ab$', 'bar', r'r\s\d$']
+
+@pytest.mark.parametrize('pat', CRLF_PATTERNS)
+def test_scan_crlf(tmp_path, pat):
+    """Lines ending in CRLF are matched without their \\r, as by the line by line parser."""
+
+    fl = tmp_path / 't.txt'
+    fl.write_bytes(b'foo\r\nfoo\r\nbar 1\r\nab\r\nlast foo')
+    expected = list(search_tools._txt_stream(fl = str(fl), pat = pat))
+    assert expected
+    assert list(mmap_engine(fl = str(fl), pattern = pat)._scan()) == expected
+    assert list(mmap_engine(fl = str(fl), pattern = pat)._parallel_scan(workers = 3)) == expected
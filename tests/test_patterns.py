@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import re
+import pytest
+from lib.exceptions import InputflError
+from lib.patterns import pattern_set
+
+def test_global_flags_are_scoped():
+    """Leading global flags only apply to their own pattern in the combined regex."""
+
+    pset = pattern_set(patterns = ['(?i)ALPHA', r'beta\d'])
+    regex = re.compile(pset.combined)
+    assert regex.search('alpha') and regex.search('beta1')
+    assert not regex.search('BETA1')
+    assert [p for p, _ in pset._tags(text = 'Alpha beta1')] == ['(?i)ALPHA', r'beta\d']
+
+def test_group_references_are_rejected():
+    """Group numbers shift in the combined regex, so patterns with group references cannot be combined."""
+
+    with pytest.raises(InputflError):
+        pattern_set(patterns = [r'(a)\1', r'(b)\1'])
+    with pytest.raises(InputflError):
+        pattern_set(patterns = ['(?P<q>a)', '(?P<q>b)'])
+    assert pattern_set(patterns = [r'(a)\1']).combined == r'(?:(a)\1)'
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import os, sqlite3, subprocess, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _run(cwd, *args) -> None:
+    subprocess.run([sys.executable, os.path.join(ROOT, 'query.py'), *args], cwd = cwd, check = True, capture_output = True)
+
+def _rows(cwd) -> list[tuple]:
+    con = sqlite3.connect(os.path.join(cwd, 'a.db'))
+    try:
+        return con.execute('SELECT line_no, value FROM a_table ORDER BY line_no').fetchall()
+    finally:
+        con.close()
+
+def test_append_resume_keeps_rows(tmp_path):
+    """A database appended from a checkpoint keeps the rows of the lines before it, a rewritten file replaces them."""
+
+    fl = tmp_path / 'a.txt'
+    fl.write_text('error 1\nok\n')
+    args = ('-f', 'a.txt', '-p', 'error', '-db', '-append', '-resume', 'cp.json')
+    _run(tmp_path, *args)
+    with open(fl, 'a') as f:
+        f.write('error 2\n')
+    _run(tmp_path, *args)
+    assert _rows(tmp_path) == [(0, 'error 1'), (2, 'error 2')]
+
+    fl.write_text('error 3\n')      # Truncated: scanned again from the start.
+    _run(tmp_path, *args)
+    assert _rows(tmp_path) == [(0, 'error 3')]
+
+def test_append_fixed_replaces_rows(tmp_path):
+    """-fixed rows are keyed on the patterns as given, so the rows of a changed file are replaced."""
+
+    fl = tmp_path / 'a.txt'
+    fl.write_text('a.b one\nx\n')
+    args = ('-f', 'a.txt', '-p', 'a.b', '-fixed', '-db', '-append')
+    _run(tmp_path, *args)
+    fl.write_text('x\na.b two\naxb\n')
+    _run(tmp_path, *args)
+    assert _rows(tmp_path) == [(1, 'a.b two')]
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import re
+import pytest
+from lib.search_tool import search_tools
+
+LINES = ['session start', 'timeout', 'a.b session', '', 'user session 42', 'connect', 'stop', 'hit_rare_7 end']
+
+@pytest.mark.parametrize('pat', ['session', r'session \d+', 'hit_rare_7', r'hit_rare_\d', r'a\.b', 'zzz'])
+@pytest.mark.parametrize('block_size', [5, 64, 1024 ** 2])
+def test_literal_stream_matches_regex(tmp_path, monkeypatch, pat, block_size):
+    """Literal and prefiltered scans, of rare or common literals, report the lines of a per line regex search."""
+
+    fl = tmp_path / 't.txt'
+    fl.write_text('\n'.join(LINES * 3))
+    monkeypatch.setattr(search_tools, 'block_size', block_size)
+    regex = re.compile(pat)
+    expected = [(i, line) for i, line in enumerate(LINES * 3) if regex.search(line)]
+    assert list(search_tools._txt_stream(fl = str(fl), pat = pat)) == expected
+
+def test_fixed_patterns_keep_their_strings(tmp_path):
+    """With fixed, metacharacters match themselves and match records keep the patterns as given."""
+
+    fl = tmp_path / 't.txt'
+    fl.write_text('a.b here\naxb here\n1+1=2\n')
+    single = search_tools(fl = str(fl), pattern = 'a.b', fixed = True)
+    assert [(r.pattern, r.line) for r in single._iter_records()] == [('a.b', 0)]
+    multi = search_tools(fl = str(fl), pattern = 'a.b', patterns = ['1+1=2'], fixed = True)
+    assert [(r.pattern, r.line) for r in multi._iter_records()] == [('a.b', 0), ('1+1=2', 2)]
+
+@pytest.mark.parametrize('pat', ['session', r'a\.b', 'hit_rare_7', r'session \d+'])
+def test_record_offsets(tmp_path, pat):
+    """Match records of literal patterns get the offsets a regex search gives."""
+
+    fl = tmp_path / 't.txt'
+    fl.write_text('\n'.join(LINES))
+    regex = re.compile(pat)
+    expected = [(i, m.start(), m.end(), m.group()) for i, line in enumerate(LINES) if (m := regex.search(line))]
+    records = search_tools(fl = str(fl), pattern = pat)._iter_records()
+    assert [(r.line, r.start, r.end, r.text) for r in records] == expected